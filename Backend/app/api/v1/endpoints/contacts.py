@@ -10,6 +10,7 @@ from pydantic import BaseModel, Field
 
 from app.core.database import get_database
 from app.dependencies.auth import get_current_user
+from app.services.estimate_service import invalidate_customer
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -360,6 +361,8 @@ async def update_contact(
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Contact not found")
         
+        invalidate_customer(contact_id)
+        
         # Get updated contact
         updated_contact = await db.contacts.find_one({
             "_id": ObjectId(contact_id),
@@ -396,6 +399,8 @@ async def delete_contact(
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Contact not found")
         
+        invalidate_customer(contact_id)
+        
         return {"message": "Contact deleted successfully"}
         
     except HTTPException:
@@ -11,6 +11,7 @@ from app.core.database import get_database
 from app.dependencies.auth import get_current_active_user
 from app.models.user import UserRole
 from app.core.logger import get_logger
+from app.services.estimate_service import invalidate_customer
 import asyncio
 logger = get_logger(__name__)
 
@@ -1049,6 +1050,7 @@ async def update_customer_profile(
                 {"$set": update_data}
             )
             contact_id = contact["_id"]
+            invalidate_customer(contact_id)
         else:
             # Create new contact
             new_contact = {
@@ -600,7 +600,7 @@
 # backend/app/api/v1/endpoints/documents.py - SIMPLIFIED VERSION
 
 from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File, Form
 from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
@@ -609,6 +609,8 @@ from pydantic import BaseModel
 import io
 import logging
 import aiofiles
+import asyncio
+import mimetypes
 import os
 from pathlib import Path
 
@@ -616,6 +618,9 @@ from app.core.database import get_database
 from app.dependencies.auth import get_current_user
 from app.core.logger import get_logger
 from app.core.utils import serialize_document
+from app.models.document import DocumentStatus
+from app.schemas.document import DocumentUploadInit
+from app.services.document_service import DocumentService, DOCUMENT_LIST_PROJECTION
 
 router = APIRouter()
 logger = get_logger(__name__)
@@ -701,8 +706,8 @@ async def get_documents(
         
         company_id = get_company_id(current_user)
         
-        # Build query
-        query = {"company_id": company_id}
+        # Build query; resumable uploads still in progress are not listed
+        query = {"company_id": company_id, "status": {"$ne": DocumentStatus.UPLOADING}}
         
         if q:
             query["$or"] = [
@@ -716,7 +721,7 @@ async def get_documents(
             query["document_type"] = document_type
             
         if status:
-            query["status"] = status
+            query["status"]["$eq"] = status
             
         if direction:
             query["direction"] = direction
@@ -733,23 +738,51 @@ async def get_documents(
         if approval_required is not None:
             query["approval_required"] = approval_required
         
-        # Get total count
-        total = await db.documents.count_documents(query)
+        # Filter and sort before the $facet so the indexes can be used; the
+        # page and the total come back in one round trip
+        list_pipeline = [
+            {"$match": query},
+            {"$sort": {"created_at": -1}},
+            {"$facet": {
+                "documents": [
+                    {"$skip": skip},
+                    {"$limit": limit},
+                    {"$project": DOCUMENT_LIST_PROJECTION}
+                ],
+                "total": [{"$count": "count"}]
+            }}
+        ]
         
-        # Get documents with pagination
-        cursor = db.documents.find(query).skip(skip).limit(limit).sort("created_at", -1)
-        documents = await cursor.to_list(length=limit)
+        # Filter options cover all of the company's documents, in one pass
+        filters_pipeline = [
+            {"$match": {"company_id": company_id, "status": {"$ne": DocumentStatus.UPLOADING}}},
+            {"$group": {
+                "_id": None,
+                "document_types": {"$addToSet": "$document_type"},
+                "statuses": {"$addToSet": "$status"},
+                "customer_emails": {"$addToSet": "$uploaded_by_email"}
+            }}
+        ]
+        
+        list_result, filters_result = await asyncio.gather(
+            db.documents.aggregate(list_pipeline).to_list(1),
+            db.documents.aggregate(filters_pipeline).to_list(1)
+        )
+        
+        facet = list_result[0]
+        total = facet["total"][0]["count"] if facet["total"] else 0
+        filters = filters_result[0] if filters_result else {}
         
         # Serialize documents
-        serialized_docs = [serialize_document(doc) for doc in documents]
+        serialized_docs = [serialize_document(doc) for doc in facet["documents"]]
         
         # Get distinct values for filters
-        document_types = await db.documents.distinct("document_type", {"company_id": company_id})
-        statuses = await db.documents.distinct("status", {"company_id": company_id})
+        document_types = filters.get("document_types", [])
+        statuses = filters.get("statuses", [])
         directions = ["admin_to_customer", "customer_to_admin"]
         
         # ✅ SIMPLE: Get unique customer emails directly from documents
-        customer_emails = await db.documents.distinct("uploaded_by_email", {"company_id": company_id})
+        customer_emails = filters.get("customer_emails", [])
         
         # Create simple customer list from emails
         customers = [
@@ -797,7 +830,8 @@ async def get_customer_documents(
         # Build query - get documents uploaded by this user
         query = {
             "company_id": company_id,
-            "uploaded_by_email": user_email
+            "uploaded_by_email": user_email,
+            "status": {"$ne": DocumentStatus.UPLOADING}
         }
         
         if q:
@@ -811,7 +845,7 @@ async def get_customer_documents(
             query["document_type"] = document_type
             
         if status:
-            query["status"] = status
+            query["status"]["$eq"] = status
         
         # Get total count
         total = await db.documents.count_documents(query)
@@ -858,7 +892,7 @@ async def download_document(
         logger.info(f"Serving file for document {document_id}, download={download}")
         
         # Get document from database
-        document = await db.documents.find_one({"_id": ObjectId(document_id)})
+        document = await db.documents.find_one({"_id": ObjectId(document_id), "status": {"$ne": DocumentStatus.UPLOADING}})
         
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -905,7 +939,7 @@ async def get_document(
 ):
     """Get a specific document"""
     try:
-        document = await db.documents.find_one({"_id": ObjectId(document_id)})
+        document = await db.documents.find_one({"_id": ObjectId(document_id), "status": {"$ne": DocumentStatus.UPLOADING}})
         
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -1018,6 +1052,95 @@ async def upload_document(
         logger.error(f"Error uploading document: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to upload document: {str(e)}")
 
+# ================================
+# RESUMABLE (CHUNKED) UPLOADS
+# ================================
+
+@router.post("/uploads")
+async def initiate_upload(
+    upload_in: DocumentUploadInit,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Start a resumable upload; returns the upload ID and chunk size"""
+    company_id = get_company_id(current_user)
+    user_id = get_user_id(current_user)
+    user_email = current_user.get("email")
+    
+    direction = upload_in.direction
+    if not direction:
+        direction = "customer_to_admin" if current_user.get("role") == "customer" else "admin_to_customer"
+    
+    # Same record as a direct upload; the ID is allocated up front so the
+    # file URL is final from the start
+    document_id = ObjectId()
+    document_data = {
+        "_id": document_id,
+        "company_id": company_id,
+        "title": upload_in.title,
+        "description": upload_in.description or "",
+        "document_type": upload_in.document_type,
+        "direction": direction,
+        "file_name": upload_in.file_name,
+        "file_url": f"/api/v1/documents/{document_id}/file",
+        "mime_type": mimetypes.guess_type(upload_in.file_name)[0] or "application/octet-stream",
+        "customer_id": upload_in.customer_id or user_id,
+        "customer_email": upload_in.customer_email or user_email,
+        "uploaded_by": user_id,
+        "uploaded_by_email": user_email,
+        "uploaded_by_role": current_user.get("role"),
+        "requires_signature": upload_in.requires_signature,
+        "is_signed": False,
+        "approval_required": upload_in.approval_required,
+        "tags": upload_in.tags,
+        "expires_at": upload_in.expires_at,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+    
+    document_service = DocumentService(db)
+    return await document_service.initiate_upload(
+        file_name=upload_in.file_name,
+        file_size=upload_in.file_size,
+        document_data=document_data,
+        company_id=company_id,
+        sha256=upload_in.sha256
+    )
+
+@router.patch("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    index: int = Query(..., ge=0, description="Zero-based chunk number"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Upload one chunk; the request body is the raw chunk bytes"""
+    if not ObjectId.is_valid(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    document_service = DocumentService(db)
+    return await document_service.append_chunk(
+        upload_id=upload_id,
+        company_id=get_company_id(current_user),
+        index=index,
+        data=await request.body()
+    )
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Finish a resumable upload once all chunks have been received"""
+    if not ObjectId.is_valid(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    document_service = DocumentService(db)
+    completed_document = await document_service.complete_upload(upload_id, get_company_id(current_user))
+    return serialize_document(completed_document)
+
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: str,
@@ -60,6 +60,20 @@ async def get_estimates(
         )
         estimates = await cursor.to_list(length=size)
 
+        # Fetch the page's customers from users (role="customer") in one query
+        customer_ids = {
+            ObjectId(est["customer_id"])
+            for est in estimates
+            if est.get("customer_id") and ObjectId.is_valid(str(est["customer_id"]))
+        }
+        customers_by_id: Dict[ObjectId, Dict[str, Any]] = {}
+        if customer_ids:
+            async for customer in db.users.find(
+                {"_id": {"$in": list(customer_ids)}, "role": "customer"},
+                {"first_name": 1, "last_name": 1, "email": 1, "phone": 1}
+            ):
+                customers_by_id[customer["_id"]] = customer
+
         formatted: List[Dict[str, Any]] = []
         for est in estimates:
             # lookup customer from users collection
@@ -69,11 +83,7 @@ async def get_estimates(
 
             if est.get("customer_id"):
                 if ObjectId.is_valid(str(est["customer_id"])):
-                    # Fetch from users collection where role="customer"
-                    customer = await db.users.find_one({
-                        "_id": ObjectId(est["customer_id"]),
-                        "role": "customer"
-                    })
+                    customer = customers_by_id.get(ObjectId(est["customer_id"]))
                     if customer:
                         customer_name = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip()
                         customer_email = customer.get("email", "")
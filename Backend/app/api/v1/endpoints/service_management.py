@@ -10,6 +10,7 @@ from pydantic import Field
 from app.core.database import get_database
 from app.dependencies.auth import get_current_user
 from app.core.logger import get_logger
+from app.services.enhanced_ai_service import invalidate_company_services
 
 logger = get_logger("endpoints.service_management")
 router = APIRouter(prefix="/service-management", tags=["service-management"])
@@ -161,6 +162,7 @@ async def create_service(
         }
         
         result = await db.ai_services.insert_one(service_doc)
+        invalidate_company_services(current_user["company_id"])
         
         # Fetch the created service
         created_service = await db.ai_services.find_one({"_id": result.inserted_id})
@@ -216,6 +218,7 @@ async def update_service(
             {"_id": ObjectId(service_id)},
             {"$set": update_data}
         )
+        invalidate_company_services(current_user["company_id"])
         
         logger.info(f"Service updated: {service_data.name} for company {current_user['company_id']}")
         
@@ -248,6 +251,7 @@ async def delete_service(
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Service not found")
+        invalidate_company_services(current_user["company_id"])
         
         logger.info(f"Service deleted: {service_id} for company {current_user['company_id']}")
         return {"message": "Service deleted successfully"}
@@ -285,6 +289,7 @@ async def toggle_service_status(
                 }
             }
         )
+        invalidate_company_services(current_user["company_id"])
         
         logger.info(f"Service {service_id} status changed to: {new_status}")
         return {"message": f"Service {'activated' if new_status else 'deactivated'} successfully"}
@@ -73,6 +73,7 @@ class Settings(PydanticBaseSettings):
     MONGODB_MIN_POOL_SIZE: int = 10
     MONGODB_MAX_POOL_SIZE: int = 100
     MONGODB_MAX_IDLE_TIME_MS: int = 30000
+    ESTIMATES_SEARCH_INDEX: Optional[str] = None  # Atlas Search index name; unset uses the text index
     
     # Redis Settings
     REDIS_URL: str = "redis://localhost:6379"
@@ -91,6 +92,12 @@ class Settings(PydanticBaseSettings):
     # SendGrid (Alternative to SMTP)
     SENDGRID_API_KEY: Optional[str] = None
     
+    # Outbound email rate limits (token bucket: sustained rate + burst size)
+    SENDGRID_RATE_PER_SECOND: float = 10.0
+    SENDGRID_RATE_BURST: int = 100
+    SMTP_RATE_PER_SECOND: float = 5.0
+    SMTP_RATE_BURST: int = 20
+    
     # SMS Settings - Twilio
     TWILIO_ACCOUNT_SID: Optional[str] = None
     TWILIO_AUTH_TOKEN: Optional[str] = None
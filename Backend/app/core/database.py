@@ -1,11 +1,12 @@
 # app/core/database.py
 import motor.motor_asyncio
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure, ServerSelectionTimeoutError
 from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
 import logging
 from typing import Optional
 import asyncio
+from datetime import datetime
 from fastapi import HTTPException
 from .config import settings
 
@@ -18,6 +19,7 @@ class DatabaseManager:
         self.client: Optional[AsyncIOMotorClient] = None
         self.database: Optional[AsyncIOMotorDatabase] = None
         self.connected = False
+        self._migrations_task: Optional[asyncio.Task] = None
     
     async def connect(self) -> None:
         """Create database connection"""
@@ -48,6 +50,10 @@ class DatabaseManager:
             # Create indexes for better performance
             await self.create_indexes()
             
+            # One-time data migrations can scan whole collections, so they
+            # run in the background instead of holding up startup
+            self._migrations_task = asyncio.create_task(self.run_migrations())
+            
         except ConnectionFailure as e:
             logger.error(f"❌ Failed to connect to MongoDB: {e}")
             raise
@@ -62,6 +68,9 @@ class DatabaseManager:
         """Close database connection"""
         logger.info("Closing MongoDB connection...")
         
+        if self._migrations_task and not self._migrations_task.done():
+            self._migrations_task.cancel()
+        
         if self.client:
             self.client.close()
             self.connected = False
@@ -145,12 +154,23 @@ class DatabaseManager:
             # Estimates collection indexes
             await db.estimates.create_indexes([
                 IndexModel([("company_id", ASCENDING)], name="company_id_idx"),
-                IndexModel([("company_id", ASCENDING), ("status", ASCENDING)], name="company_status_idx"),
-                IndexModel([("company_id", ASCENDING), ("customer_id", ASCENDING)], name="company_customer_idx"),
+                IndexModel([("company_id", ASCENDING), ("created_at", DESCENDING)], name="company_created_idx"),
+                IndexModel([("company_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)], name="company_status_created_idx"),
+                IndexModel([("company_id", ASCENDING), ("customer_id", ASCENDING), ("created_at", DESCENDING)], name="company_customer_created_idx"),
+                IndexModel([("company_id", ASCENDING), ("total_amount", ASCENDING)], name="company_total_amount_idx"),
+                # Global: the estimates router numbers estimates without a company
+                # scope, and EstimateService keeps one counter per day to match
                 IndexModel([("estimate_number", ASCENDING)], unique=True, name="estimate_number_unique"),
                 IndexModel([("valid_until", ASCENDING)], name="valid_until_idx"),
+                IndexModel([("company_id", ASCENDING), ("valid_until", ASCENDING)], name="company_valid_until_idx"),
+                IndexModel(
+                    [("title", TEXT), ("estimate_number", TEXT), ("description", TEXT)],
+                    name="estimate_text_idx"
+                ),
                 IndexModel([("created_at", DESCENDING)], name="created_at_desc")
             ])
+            # Superseded by the created_at compounds above
+            await self._drop_stale_indexes(db.estimates, ["company_status_idx", "company_customer_idx"])
             
             # Invoices collection indexes
             await db.invoices.create_indexes([
@@ -163,6 +183,24 @@ class DatabaseManager:
                 IndexModel([("created_at", DESCENDING)], name="created_at_desc")
             ])
             
+            # Documents collection indexes
+            await db.documents.create_indexes([
+                IndexModel([("company_id", ASCENDING), ("created_at", DESCENDING)], name="company_created_idx"),
+                IndexModel([("company_id", ASCENDING), ("requires_signature", ASCENDING), ("is_signed", ASCENDING), ("created_at", DESCENDING)], name="company_signature_idx"),
+                IndexModel([("tags", ASCENDING)], name="tags_idx"),
+                IndexModel(
+                    [("expires_at", ASCENDING)],
+                    partialFilterExpression={"expires_at": {"$exists": True}},
+                    name="expires_at_partial_idx"
+                ),
+                # Abandoned resumable uploads are found per company by age
+                IndexModel(
+                    [("company_id", ASCENDING), ("updated_at", ASCENDING)],
+                    partialFilterExpression={"status": "uploading"},
+                    name="uploading_partial_idx"
+                )
+            ])
+
             # SMS Messages collection indexes
             await db.sms_messages.create_indexes([
                 IndexModel([("company_id", ASCENDING)], name="company_id_idx"),
@@ -173,6 +211,39 @@ class DatabaseManager:
                 IndexModel([("created_at", DESCENDING)], name="created_at_desc")
             ])
             
+            # Email Messages collection indexes
+            await db.email_messages.create_indexes([
+                IndexModel([("company_id", ASCENDING), ("created_at", DESCENDING)], name="company_created_idx"),
+                IndexModel([("company_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)], name="company_status_created_idx"),
+                IndexModel(
+                    [("status", ASCENDING), ("scheduled_at", ASCENDING)],
+                    partialFilterExpression={"status": "scheduled"},
+                    name="scheduled_partial_idx"
+                ),
+                IndexModel([("contact_id", ASCENDING)], name="contact_id_idx")
+            ])
+            
+            # Email analytics daily rollups
+            await db.email_analytics_daily.create_indexes([
+                IndexModel([("company_id", ASCENDING), ("day", ASCENDING)], unique=True, name="company_day_unique")
+            ])
+            
+            # AI service catalog and interaction log indexes
+            await db.ai_services.create_indexes([
+                IndexModel([("company_id", ASCENDING), ("active", ASCENDING)], name="company_active_idx"),
+                IndexModel([("company_id", ASCENDING), ("name", ASCENDING)], name="company_name_idx")
+            ])
+            # Creating the time-series collection can fail on older servers
+            # or for permissions; that must not skip the indexes below
+            try:
+                await self._create_ai_interactions_collection()
+                await db.ai_interactions.create_indexes([
+                    IndexModel([("company_id", ASCENDING), ("timestamp", DESCENDING), ("service_id", ASCENDING)], name="company_timestamp_service_idx"),
+                    IndexModel([("company_id", ASCENDING), ("timestamp", DESCENDING), ("intent", ASCENDING)], name="company_timestamp_intent_idx")
+                ])
+            except Exception as e:
+                logger.error(f"❌ Error setting up ai_interactions collection: {e}")
+            
             # AI Flows collection indexes
             await db.ai_flows.create_indexes([
                 IndexModel([("company_id", ASCENDING)], name="company_id_idx"),
@@ -189,6 +260,11 @@ class DatabaseManager:
                 IndexModel([("name", ASCENDING)], name="name_idx")
             ])
             
+            # Integration logs are read per integration, newest first
+            await db.integration_logs.create_indexes([
+                IndexModel([("integration_id", ASCENDING), ("company_id", ASCENDING), ("created_at", DESCENDING)], name="integration_company_created_idx")
+            ])
+            
             # Analytics/Metrics collection indexes
             await db.analytics.create_indexes([
                 IndexModel([("company_id", ASCENDING)], name="company_id_idx"),
@@ -240,6 +316,144 @@ class DatabaseManager:
             logger.error(f"❌ Error creating database indexes: {e}")
             # Don't raise here as the app can still function without indexes
     
+    async def run_migrations(self) -> None:
+        """Run each pending one-time data migration once.
+        
+        A migration claims its marker document in the migrations collection
+        before running, so only one worker executes it; the marker is removed
+        again on failure so the next startup retries.
+        """
+        migrations = [
+            ("email_analytics_daily_backfill", self._backfill_email_analytics),
+        ]
+        for name, migrate in migrations:
+            try:
+                await self.database.migrations.insert_one({"_id": name, "started_at": datetime.utcnow()})
+            except DuplicateKeyError:
+                continue
+            except Exception as e:
+                logger.error(f"❌ Could not claim migration {name}: {e}")
+                continue
+            
+            try:
+                logger.info(f"🚨 MIGRATION STARTED: {name}")
+                await migrate()
+                await self.database.migrations.update_one(
+                    {"_id": name},
+                    {"$set": {"completed_at": datetime.utcnow()}}
+                )
+                logger.info(f"✅ MIGRATION COMPLETE: {name}")
+            except asyncio.CancelledError:
+                await self.database.migrations.delete_one({"_id": name})
+                raise
+            except Exception as e:
+                logger.error(f"❌ Migration {name} failed: {e}")
+                await self.database.migrations.delete_one({"_id": name})
+    
+    async def _backfill_email_analytics(self) -> None:
+        """Rebuild email_analytics_daily for messages sent before the rollups existed.
+        
+        Messages are grouped by company and UTC creation day into the same
+        document shape the email service maintains, then merged into the
+        rollup collection. Days before today are replaced wholesale, since
+        their messages are all in email_messages. Today's bucket already
+        holds live counts for messages sent since the rollups were
+        deployed, so the messages sent earlier today, up to the start of
+        this migration, are added to it instead.
+        """
+        started_at = datetime.utcnow()
+        today = datetime(started_at.year, started_at.month, started_at.day)
+        
+        past_days = self._email_rollup_pipeline({"$lt": today})
+        past_days.append({"$merge": {
+            "into": "email_analytics_daily",
+            "on": ["company_id", "day"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }})
+        
+        earlier_today = self._email_rollup_pipeline({"$gte": today, "$lt": started_at})
+        earlier_today.append({"$merge": {
+            "into": "email_analytics_daily",
+            "on": ["company_id", "day"],
+            "whenMatched": [{"$set": {
+                "opens": {"$add": [{"$ifNull": ["$opens", 0]}, "$$new.opens"]},
+                "clicks": {"$add": [{"$ifNull": ["$clicks", 0]}, "$$new.clicks"]},
+                "bounced": {"$add": [{"$ifNull": ["$bounced", 0]}, "$$new.bounced"]},
+                # Sum the per-status counts of both documents key by key
+                "status": {"$let": {
+                    "vars": {"counts": {"$concatArrays": [
+                        {"$objectToArray": {"$ifNull": ["$status", {}]}},
+                        {"$objectToArray": "$$new.status"}
+                    ]}},
+                    "in": {"$arrayToObject": {"$map": {
+                        "input": {"$setUnion": ["$$counts.k"]},
+                        "as": "key",
+                        "in": {
+                            "k": "$$key",
+                            "v": {"$sum": {"$map": {
+                                "input": {"$filter": {"input": "$$counts", "cond": {"$eq": ["$$this.k", "$$key"]}}},
+                                "in": "$$this.v"
+                            }}}
+                        }
+                    }}}
+                }}
+            }}],
+            "whenNotMatched": "insert"
+        }})
+        
+        # $merge writes server-side; draining the cursor runs the pipeline
+        await self.database.email_messages.aggregate(past_days, allowDiskUse=True).to_list(None)
+        await self.database.email_messages.aggregate(earlier_today, allowDiskUse=True).to_list(None)
+    
+    def _email_rollup_pipeline(self, created_at: dict) -> list:
+        """Stages grouping messages created in a range into daily rollup documents"""
+        return [
+            {"$match": {"company_id": {"$ne": None}, "created_at": created_at}},
+            {"$group": {
+                "_id": {
+                    "company_id": "$company_id",
+                    "day": {"$dateFromParts": {
+                        "year": {"$year": "$created_at"},
+                        "month": {"$month": "$created_at"},
+                        "day": {"$dayOfMonth": "$created_at"}
+                    }},
+                    "status": {"$ifNull": ["$status", "unknown"]}
+                },
+                "count": {"$sum": 1},
+                "opens": {"$sum": {"$ifNull": ["$tracking.opens", 0]}},
+                "clicks": {"$sum": {"$ifNull": ["$tracking.clicks", 0]}},
+                "bounced": {"$sum": {"$cond": [{"$eq": ["$tracking.bounced", True]}, 1, 0]}}
+            }},
+            {"$group": {
+                "_id": {"company_id": "$_id.company_id", "day": "$_id.day"},
+                "status": {"$push": {"k": "$_id.status", "v": "$count"}},
+                "opens": {"$sum": "$opens"},
+                "clicks": {"$sum": "$clicks"},
+                "bounced": {"$sum": "$bounced"}
+            }},
+            {"$project": {
+                "_id": 0,
+                "company_id": "$_id.company_id",
+                "day": "$_id.day",
+                "status": {"$arrayToObject": "$status"},
+                "opens": 1,
+                "clicks": 1,
+                "bounced": 1
+            }}
+        ]
+    
+    async def _drop_stale_indexes(self, collection, names: list) -> None:
+        """Drop indexes removed from the definitions, ignoring ones already gone"""
+        for name in names:
+            try:
+                await collection.drop_index(name)
+                logger.info(f"✅ Dropped stale index {collection.name}.{name}")
+            except OperationFailure as e:
+                # 27 = IndexNotFound; 26 = NamespaceNotFound on a new database
+                if e.code not in (26, 27):
+                    raise
+    
     async def drop_indexes(self, collection_name: str) -> bool:
         """Drop all indexes for a collection (except _id)"""
         try:
@@ -316,6 +530,35 @@ class DatabaseManager:
         
         return health_status
     
+    async def _create_ai_interactions_collection(self) -> None:
+        """Create ai_interactions as a time-series collection on first run.
+        
+        Interactions are append-only and only ever read by company and time
+        range, so bucketing them per company keeps analytics scans and
+        indexes small as history grows. An existing regular collection is
+        left as is and its data is not migrated: time-series collections
+        cannot be renamed, so converting one means copying into a new
+        collection during a maintenance window.
+        """
+        db = self.database
+        if await db.list_collection_names(filter={"name": "ai_interactions"}):
+            return
+        
+        try:
+            await db.create_collection(
+                "ai_interactions",
+                timeseries={
+                    "timeField": "timestamp",
+                    "metaField": "company_id",
+                    "granularity": "hours"
+                }
+            )
+            logger.info("✅ Created ai_interactions time-series collection")
+        except OperationFailure as e:
+            # Servers before MongoDB 5.0 have no time-series collections;
+            # inserts then create a regular collection
+            logger.warning(f"⚠️ Could not create ai_interactions as time-series: {e}")
+    
     def get_collection(self, name: str):
         """Get a collection by name"""
         if not self.database:
@@ -27,6 +27,9 @@ import logging
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone
 from app.core.database import connect_to_mongo, close_mongo_connection 
+from app.services.email_service import close_email_clients
+from app.services.enhanced_ai_service import close_ai_clients
+from app.services.integration_service import close_integration_clients
 from fastapi.responses import JSONResponse
 from app.core.utils import custom_jsonable_encoder
 from bson import ObjectId
@@ -145,6 +148,9 @@ async def lifespan(app: FastAPI):
     finally:
         logger.info("🔄 Shutting down AI-Enhanced SaaS CRM...")
         try:
+            await close_email_clients()
+            await close_ai_clients()
+            await close_integration_clients()
             await close_mongo_connection()
             await shutdown_core()
             logger.info("✅ Application shutdown completed successfully")
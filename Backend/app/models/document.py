@@ -6,6 +6,7 @@ from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 from datetime import datetime
+from enum import Enum
 from pydantic import BaseModel
 import io
 import logging
@@ -17,6 +18,37 @@ from app.core.logger import get_logger
 router = APIRouter()
 logger = get_logger(__name__)
 
+# ================================
+# ENUMS
+# ================================
+
+class DocumentType(str, Enum):
+    """Document type"""
+    GENERAL = "general"
+    AGREEMENT = "agreement"
+    CONTRACT = "contract"
+    ID_CARD = "id_card"
+    INVOICE = "invoice"
+    RECEIPT = "receipt"
+
+class DocumentStatus(str, Enum):
+    """Document status"""
+    UPLOADING = "uploading"  # resumable upload still receiving chunks
+    PENDING = "pending"
+    APPROVED = "approved"
+    REJECTED = "rejected"
+
+class DocumentDirection(str, Enum):
+    """Who sent the document to whom"""
+    ADMIN_TO_CUSTOMER = "admin_to_customer"
+    CUSTOMER_TO_ADMIN = "customer_to_admin"
+
+class DocumentAccessLevel(str, Enum):
+    """Who can see the document"""
+    PRIVATE = "private"
+    COMPANY = "company"
+    PUBLIC = "public"
+
 # ================================
 # PYDANTIC MODELS
 # ================================
@@ -51,6 +51,7 @@ class Integration(BaseModel):
     status: IntegrationStatus = IntegrationStatus.DISCONNECTED
     config: Dict[str, Any] = Field(default_factory=dict)
     encrypted_config: Dict[str, str] = Field(default_factory=dict)  # For sensitive data
+    config_hash: Optional[str] = None  # Keyed digest of the submitted config
     last_sync: Optional[datetime] = None
     last_error: Optional[str] = None
     is_enabled: bool = True
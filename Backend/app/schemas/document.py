@@ -47,6 +47,16 @@ class DocumentUpload(BaseModel):
     tags: List[str] = Field(default_factory=list, description="Document tags")
     requires_signature: bool = Field(default=False, description="Requires signature")
 
+class DocumentUploadInit(DocumentUpload):
+    """Schema for starting a resumable (chunked) upload"""
+    document_type: str = Field("general", description="Document type")
+    customer_email: Optional[str] = Field(None, description="Customer email")
+    direction: Optional[str] = Field(None, description="Document direction")
+    approval_required: bool = Field(default=False, description="Requires approval")
+    file_name: str = Field(..., description="File name")
+    file_size: int = Field(..., ge=0, description="Total file size in bytes")
+    sha256: Optional[str] = Field(None, description="SHA-256 hex digest checked on completion")
+
 class DocumentSign(BaseModel):
     """Schema for document signing"""
     signature_data: Dict[str, Any] = Field(..., description="Signature data")
@@ -1,11 +1,10 @@
 # backend/app/services/customer_notification_service.py - FIXED TO READ FROM .ENV
 
-import smtplib
+import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 import logging
-import asyncio
 import hashlib
 import base64
 from typing import Dict, Any, Optional
@@ -265,26 +264,23 @@ class CustomerNotificationService:
             msg.attach(text_part)
             msg.attach(html_part)
             
-            # Send email in thread pool to avoid blocking
-            def send_sync():
-                try:
-                    logger.info(f"Connecting to SMTP server: {self.smtp_server}:{self.smtp_port}")
-                    with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                        server.starttls()
-                        logger.info(f"Logging in with user: {self.email_user}")
-                        server.login(self.email_user, self.email_password)
-                        logger.info("Login successful, sending message...")
-                        server.send_message(msg)
-                        logger.info("Message sent successfully!")
-                    return True
-                except Exception as e:
-                    logger.error(f"❌ SMTP Error: {e}")
-                    return False
-            
-            # Run in thread pool
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(None, send_sync)
-            return result
+            # aiosmtplib runs the SMTP conversation on the event loop, so
+            # concurrent sends don't each tie up a thread-pool worker
+            try:
+                logger.info(f"Connecting to SMTP server: {self.smtp_server}:{self.smtp_port}")
+                await aiosmtplib.send(
+                    msg,
+                    hostname=self.smtp_server,
+                    port=self.smtp_port,
+                    start_tls=True,
+                    username=self.email_user,
+                    password=self.email_password
+                )
+                logger.info("Message sent successfully!")
+                return True
+            except Exception as e:
+                logger.error(f"❌ SMTP Error: {e}")
+                return False
             
         except Exception as e:
             logger.error(f"❌ Email sending failed: {e}")
@@ -1,10 +1,14 @@
 # backend/app/services/document_service.py
 import os
 import uuid
+import shutil
+import asyncio
+import hashlib
 import aiofiles
 from typing import Optional, Dict, Any, List, Tuple
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 from bson import ObjectId
 from fastapi import HTTPException, status, UploadFile
 import mimetypes
@@ -12,7 +16,7 @@ from pathlib import Path
 
 from app.core.logger import get_logger
 from app.core.config import settings
-from app.models.document import Document, DocumentType, DocumentStatus, DocumentDirection
+from app.models.document import DocumentType, DocumentStatus, DocumentDirection, DocumentAccessLevel
 from app.schemas.document import (
     DocumentCreate, DocumentUpdate, DocumentSearch, DocumentResponse,
     DocumentUpload, DocumentSign, DocumentApproval
@@ -20,6 +24,49 @@ from app.schemas.document import (
 
 logger = get_logger("services.document")
 
+# Resumable uploads: clients send the file in chunks of this size (the last
+# one may be shorter) and may send them in any order or in parallel
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Uploads that receive no chunk for this long are abandoned and removed
+UPLOAD_TTL = timedelta(hours=24)
+
+# Starlette spools uploads up to this size in memory; larger ones are
+# already backed by a real file
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+# Fields needed to render document listings; heavy fields such as
+# signature_data are only returned by the single-document endpoints
+DOCUMENT_LIST_PROJECTION = {
+    "_id": 1,
+    "company_id": 1,
+    "customer_id": 1,
+    "customer_email": 1,
+    "uploaded_by": 1,
+    "uploaded_by_email": 1,
+    "uploaded_by_role": 1,
+    "title": 1,
+    "description": 1,
+    "document_type": 1,
+    "status": 1,
+    "direction": 1,
+    "file_name": 1,
+    "file_url": 1,
+    "file_size": 1,
+    "mime_type": 1,
+    "tags": 1,
+    "expires_at": 1,
+    "is_signed": 1,
+    "signed_at": 1,
+    "requires_signature": 1,
+    "approval_required": 1,
+    "approved_by": 1,
+    "approved_at": 1,
+    "rejection_reason": 1,
+    "created_at": 1,
+    "updated_at": 1
+}
+
 class DocumentService:
     """Document management service"""
     
@@ -64,13 +111,17 @@ class DocumentService:
     
     def _validate_file(self, file: UploadFile) -> Tuple[bool, str]:
         """Validate uploaded file"""
+        return self._validate_file_info(file.filename or "", getattr(file, 'size', None))
+    
+    def _validate_file_info(self, filename: str, size: Optional[int]) -> Tuple[bool, str]:
+        """Validate file name and size"""
         # Check file size
         MAX_FILE_SIZE = settings.MAX_UPLOAD_SIZE
-        if hasattr(file, 'size') and file.size and file.size > MAX_FILE_SIZE:
+        if size and size > MAX_FILE_SIZE:
             return False, f"File size exceeds {settings.get_max_file_size_mb()}MB limit"
         
         # Check file type
-        ext = self._get_file_extension(file.filename or "")
+        ext = self._get_file_extension(filename)
         if ext not in settings.ALLOWED_DOCUMENT_EXTENSIONS:
             return False, f"File type {ext} not allowed"
         
@@ -80,6 +131,84 @@ class DocumentService:
         
         return True, "Valid file"
     
+    def _copy_upload_to_disk(self, source, file_path: str) -> int:
+        """Copy an upload's backing file to file_path and return its size.
+        
+        Uploads larger than the spool size are backed by a real file, which
+        the kernel copies straight between descriptors via sendfile; small
+        in-memory uploads use a buffered copy.
+        """
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+        
+        source_fd = None
+        if hasattr(os, "sendfile") and size > UPLOAD_SPOOL_SIZE:
+            try:
+                source.flush()
+                source_fd = source.fileno()
+            except (AttributeError, OSError):
+                source_fd = None
+        
+        with open(file_path, 'wb') as out:
+            if source_fd is not None:
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(out.fileno(), source_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+            else:
+                shutil.copyfileobj(source, out)
+        
+        return size
+    
+    def _build_document_dict(
+        self,
+        document_id: ObjectId,
+        document_data: DocumentUpload,
+        company_id: str,
+        uploaded_by: str,
+        file_name: str,
+        file_path: str,
+        file_size: int,
+        file_url: str
+    ) -> Dict[str, Any]:
+        """Build the database record for a new document.
+        
+        document_data has already been validated by the route, so the record
+        is assembled directly instead of going through another model.
+        """
+        now = datetime.now(timezone.utc)
+        # Direction is determined by whether the upload targets a customer
+        direction = DocumentDirection.ADMIN_TO_CUSTOMER if document_data.customer_id else DocumentDirection.CUSTOMER_TO_ADMIN
+        
+        return {
+            "_id": document_id,
+            "company_id": ObjectId(company_id),
+            "customer_id": ObjectId(document_data.customer_id) if document_data.customer_id else None,
+            "uploaded_by": ObjectId(uploaded_by),
+            "title": document_data.title,
+            "description": document_data.description,
+            "document_type": document_data.document_type,
+            "direction": direction,
+            "access_level": DocumentAccessLevel.PRIVATE,
+            "file_name": file_name,
+            "file_path": file_path,
+            "file_url": file_url,
+            "file_size": file_size,
+            "mime_type": mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
+            "status": DocumentStatus.PENDING,
+            "tags": document_data.tags,
+            "expires_at": document_data.expires_at,
+            "requires_signature": document_data.requires_signature,
+            "is_signed": False,
+            "approval_required": False,
+            "version": 1,
+            "created_at": now,
+            "updated_at": now
+        }
+    
     async def upload_document(
         self, 
         file: UploadFile, 
@@ -100,61 +229,28 @@ class DocumentService:
             # Generate file path
             file_path = self._generate_file_path(company_id, file.filename or "document")
             
-            # Save file
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
-            
-            # Get file info
-            file_size = len(content)
-            mime_type = mimetypes.guess_type(file.filename or "")[0] or 'application/octet-stream'
+            # Save file off the event loop
+            file_size = await asyncio.to_thread(self._copy_upload_to_disk, file.file, file_path)
             
-            # Determine direction based on user role and customer_id
-            direction = DocumentDirection.ADMIN_TO_CUSTOMER if document_data.customer_id else DocumentDirection.CUSTOMER_TO_ADMIN
-            
-            # Create document record
-            document = Document(
+            # Create document record; the ID is allocated up front so the
+            # file URL can be written with the insert
+            document_id = ObjectId()
+            document_dict = self._build_document_dict(
+                document_id=document_id,
+                document_data=document_data,
                 company_id=company_id,
-                customer_id=document_data.customer_id,
                 uploaded_by=uploaded_by,
-                title=document_data.title,
-                description=document_data.description,
-                document_type=document_data.document_type,
-                direction=direction,
                 file_name=file.filename or "document",
                 file_path=file_path,
-                file_url="",  # Will be updated with document ID
                 file_size=file_size,
-                mime_type=mime_type,
-                tags=document_data.tags,
-                expires_at=document_data.expires_at,
-                requires_signature=document_data.requires_signature
+                file_url=f"/api/v1/documents/{document_id}/file"
             )
             
-            # Insert document
-            document_dict = document.dict(exclude={"id"})
-            # Convert string IDs to ObjectIds for database
-            if document_dict.get("company_id"):
-                document_dict["company_id"] = ObjectId(document_dict["company_id"])
-            if document_dict.get("customer_id"):
-                document_dict["customer_id"] = ObjectId(document_dict["customer_id"])
-            if document_dict.get("uploaded_by"):
-                document_dict["uploaded_by"] = ObjectId(document_dict["uploaded_by"])
-            
-            result = await self.documents_collection.insert_one(document_dict)
-            document_id = str(result.inserted_id)
-            
-            # Update file URL with document ID
-            await self.documents_collection.update_one(
-                {"_id": result.inserted_id},
-                {"$set": {"file_url": f"/api/v1/documents/{document_id}/file"}}
-            )
-            
-            # Get the created document
-            created_doc = await self.documents_collection.find_one({"_id": result.inserted_id})
+            await self.documents_collection.insert_one(document_dict)
+            document_id = str(document_id)
             
             logger.info(f"Document uploaded successfully: {document_id}")
-            return DocumentResponse(**self._serialize_document(created_doc))
+            return DocumentResponse(**self._serialize_document(document_dict))
             
         except Exception as e:
             logger.error(f"Error uploading document: {str(e)}")
@@ -166,6 +262,267 @@ class DocumentService:
                 detail=f"Failed to upload document: {str(e)}"
             )
     
+    def _preallocate_file(self, file_path: str, size: int) -> None:
+        """Create an empty file of the given size"""
+        with open(file_path, 'wb') as f:
+            f.truncate(size)
+    
+    def _write_chunk(self, file_path: str, offset: int, data: bytes) -> None:
+        """Write a chunk at the given offset of an existing file"""
+        with open(file_path, 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+    
+    def _file_sha256(self, file_path: str) -> str:
+        """Compute the SHA-256 hex digest of a file"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    async def initiate_upload(
+        self,
+        file_name: str,
+        file_size: int,
+        document_data: Dict[str, Any],
+        company_id: str,
+        sha256: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Start a resumable upload and return its upload ID.
+        
+        document_data is the record built by the documents endpoint, in the
+        same shape as a direct upload; company_id is the string ID it uses.
+        """
+        try:
+            is_valid, message = self._validate_file_info(file_name, file_size)
+            if not is_valid:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=message
+                )
+            
+            await self.cleanup_abandoned_uploads(company_id)
+            
+            file_path = self._generate_file_path(company_id, file_name or "document")
+            await asyncio.to_thread(self._preallocate_file, file_path, file_size)
+            
+            document_dict = {
+                **document_data,
+                "file_path": file_path,
+                "file_size": file_size,
+                "status": DocumentStatus.UPLOADING,
+                "chunk_count": -(-file_size // UPLOAD_CHUNK_SIZE),
+                "received_chunks": [],
+                "bytes_received": 0,
+                "expected_sha256": sha256
+            }
+            
+            result = await self.documents_collection.insert_one(document_dict)
+            upload_id = str(result.inserted_id)
+            
+            logger.info(f"Resumable upload initiated: {upload_id} ({file_size} bytes)")
+            return {
+                "upload_id": upload_id,
+                "chunk_size": UPLOAD_CHUNK_SIZE,
+                "file_size": file_size
+            }
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error initiating upload: {str(e)}")
+            if 'file_path' in locals() and os.path.exists(file_path):
+                os.remove(file_path)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to initiate upload: {str(e)}"
+            )
+    
+    async def append_chunk(
+        self,
+        upload_id: str,
+        company_id: str,
+        index: int,
+        data: bytes
+    ) -> Dict[str, Any]:
+        """Write chunk number index of a resumable upload.
+        
+        Every chunk but the last is exactly UPLOAD_CHUNK_SIZE bytes and is
+        written at index * UPLOAD_CHUNK_SIZE, so chunks can neither overlap
+        nor leave gaps. Re-sending a chunk that was already received is
+        harmless, so clients can simply retry failed chunks.
+        """
+        try:
+            upload_oid = ObjectId(upload_id)
+            upload = await self.documents_collection.find_one(
+                {"_id": upload_oid, "company_id": company_id, "status": DocumentStatus.UPLOADING},
+                {"file_path": 1, "file_size": 1, "chunk_count": 1}
+            )
+            
+            if not upload:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Upload not found"
+                )
+            
+            if not 0 <= index < upload["chunk_count"]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Chunk index must be between 0 and {upload['chunk_count'] - 1}"
+                )
+            
+            offset = index * UPLOAD_CHUNK_SIZE
+            expected_size = min(UPLOAD_CHUNK_SIZE, upload["file_size"] - offset)
+            if len(data) != expected_size:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Chunk {index} must be {expected_size} bytes, got {len(data)}"
+                )
+            
+            await asyncio.to_thread(self._write_chunk, upload["file_path"], offset, data)
+            
+            # Only count a chunk the first time it arrives; any chunk keeps
+            # the upload from being cleaned up as abandoned
+            now = datetime.utcnow()
+            updated = await self.documents_collection.find_one_and_update(
+                {"_id": upload_oid, "received_chunks": {"$ne": index}},
+                {
+                    "$push": {"received_chunks": index},
+                    "$inc": {"bytes_received": len(data)},
+                    "$set": {"updated_at": now}
+                },
+                projection={"bytes_received": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if updated is None:
+                updated = await self.documents_collection.find_one_and_update(
+                    {"_id": upload_oid},
+                    {"$set": {"updated_at": now}},
+                    projection={"bytes_received": 1},
+                    return_document=ReturnDocument.AFTER
+                )
+            
+            return {
+                "upload_id": upload_id,
+                "index": index,
+                "bytes_received": updated["bytes_received"],
+                "file_size": upload["file_size"]
+            }
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error writing upload chunk: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to write upload chunk: {str(e)}"
+            )
+    
+    async def complete_upload(self, upload_id: str, company_id: str) -> Dict[str, Any]:
+        """Finalize a resumable upload once every chunk has been received.
+        
+        Returns the stored record for the endpoint to serialize, like a
+        direct upload.
+        """
+        try:
+            upload_oid = ObjectId(upload_id)
+            upload = await self.documents_collection.find_one(
+                {"_id": upload_oid, "company_id": company_id, "status": DocumentStatus.UPLOADING},
+                {"file_path": 1, "chunk_count": 1, "received_chunks": 1, "expected_sha256": 1}
+            )
+            
+            if not upload:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Upload not found"
+                )
+            
+            missing = sorted(set(range(upload["chunk_count"])) - set(upload["received_chunks"]))
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Upload incomplete: missing chunks {missing[:20]}"
+                )
+            
+            if upload.get("expected_sha256"):
+                actual = await asyncio.to_thread(self._file_sha256, upload["file_path"])
+                if actual != upload["expected_sha256"].lower():
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Uploaded file checksum does not match"
+                    )
+            
+            completed_doc = await self.documents_collection.find_one_and_update(
+                {"_id": upload_oid, "status": DocumentStatus.UPLOADING},
+                {
+                    "$set": {
+                        "status": DocumentStatus.PENDING,
+                        "updated_at": datetime.utcnow()
+                    },
+                    "$unset": {"chunk_count": "", "received_chunks": "", "bytes_received": "", "expected_sha256": ""}
+                },
+                return_document=ReturnDocument.AFTER
+            )
+            
+            if not completed_doc:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Upload not found"
+                )
+            
+            logger.info(f"Resumable upload completed: {upload_id}")
+            return completed_doc
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error completing upload: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to complete upload: {str(e)}"
+            )
+    
+    def _remove_files(self, file_paths: List[str]) -> None:
+        """Delete files that may already be gone"""
+        for file_path in file_paths:
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+    
+    async def cleanup_abandoned_uploads(self, company_id: str) -> int:
+        """Remove a company's uploads that stopped receiving chunks.
+        
+        Runs whenever the company starts a new upload, so abandoned partial
+        files are removed without a separate scheduler.
+        """
+        try:
+            query = {
+                "company_id": company_id,
+                "status": DocumentStatus.UPLOADING,
+                "updated_at": {"$lt": datetime.utcnow() - UPLOAD_TTL}
+            }
+            abandoned = await self.documents_collection.find(query, {"file_path": 1}).to_list(length=None)
+            if not abandoned:
+                return 0
+            
+            # Delete one at a time with the staleness check repeated, so an
+            # upload that resumed in the meantime keeps its file
+            file_paths = []
+            for doc in abandoned:
+                result = await self.documents_collection.delete_one({"_id": doc["_id"], **query})
+                if result.deleted_count and doc.get("file_path"):
+                    file_paths.append(doc["file_path"])
+            await asyncio.to_thread(self._remove_files, file_paths)
+            
+            logger.info(f"Removed {len(file_paths)} abandoned uploads for company {company_id}")
+            return len(file_paths)
+            
+        except Exception as e:
+            logger.error(f"Error cleaning up abandoned uploads: {str(e)}")
+            return 0
+    
     async def get_documents(
         self, 
         company_id: str, 
@@ -177,8 +534,8 @@ class DocumentService:
     ) -> Dict[str, Any]:
         """Get documents with filtering"""
         try:
-            # Build base query
-            query = {"company_id": ObjectId(company_id)}
+            # Build base query, hiding resumable uploads that are still in progress
+            query = {"company_id": ObjectId(company_id), "status": {"$ne": DocumentStatus.UPLOADING}}
             
             # Role-based filtering
             if user_role == "customer":
@@ -228,18 +585,38 @@ class DocumentService:
                 if search.approval_required is not None:
                     query["approval_required"] = search.approval_required
             
-            # Get total count
-            total = await self.documents_collection.count_documents(query)
+            # Page and total count in a single round-trip. Filtering and
+            # sorting happen before $facet so they can use the indexes; the
+            # facet only splits the sorted result into a page and a count.
+            pipeline = [
+                {"$match": query},
+                {"$sort": {"created_at": -1}},
+                {"$facet": {
+                    "documents": [
+                        {"$skip": skip},
+                        {"$limit": limit},
+                        {"$project": DOCUMENT_LIST_PROJECTION}
+                    ],
+                    "total": [
+                        {"$count": "count"}
+                    ]
+                }}
+            ]
+            # Types are collected over the whole company (not the filtered
+            # set) so the filter options don't shrink as filters are applied
+            result, document_types = await asyncio.gather(
+                self.documents_collection.aggregate(pipeline, allowDiskUse=True).to_list(length=1),
+                self.documents_collection.distinct("document_type", {"company_id": ObjectId(company_id)})
+            )
+            facets = result[0] if result else {}
             
-            # Get documents
-            cursor = self.documents_collection.find(query).sort("created_at", -1).skip(skip).limit(limit)
-            documents = await cursor.to_list(length=limit)
+            total = facets["total"][0]["count"] if facets.get("total") else 0
             
             # Serialize documents
-            serialized_docs = [self._serialize_document(doc) for doc in documents]
+            serialized_docs = [self._serialize_document(doc) for doc in facets.get("documents", [])]
             
             # Get document types for filtering
-            document_types = await self.documents_collection.distinct("document_type", {"company_id": ObjectId(company_id)})
+            document_types = [t for t in document_types if t is not None]
             
             return {
                 "documents": serialized_docs,
@@ -302,7 +679,7 @@ class DocumentService:
             
             # Prepare update data
             update_data = {k: v for k, v in document_data.dict(exclude_unset=True).items() if v is not None}
-            update_data["updated_at"] = datetime.utcnow()
+            update_data["updated_at"] = datetime.now(timezone.utc)
             
             # Update document
             result = await self.documents_collection.update_one(
@@ -356,12 +733,13 @@ class DocumentService:
                 )
             
             # Update document with signature
+            now = datetime.now(timezone.utc)
             update_data = {
                 "is_signed": True,
-                "signed_at": datetime.utcnow(),
+                "signed_at": now,
                 "signed_by": ObjectId(user_id),
                 "signature_data": signature_data.signature_data,
-                "updated_at": datetime.utcnow()
+                "updated_at": now
             }
             
             await self.documents_collection.update_one(
@@ -403,15 +781,16 @@ class DocumentService:
                 )
             
             # Update document with approval status
+            now = datetime.now(timezone.utc)
             update_data = {
                 "status": approval_data.status,
-                "updated_at": datetime.utcnow()
+                "updated_at": now
             }
             
             if approval_data.status == DocumentStatus.APPROVED:
                 update_data.update({
                     "approved_by": ObjectId(user_id),
-                    "approved_at": datetime.utcnow()
+                    "approved_at": now
                 })
             elif approval_data.status == DocumentStatus.REJECTED:
                 update_data["rejection_reason"] = approval_data.rejection_reason
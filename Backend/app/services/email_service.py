@@ -1,35 +1,420 @@
 # app/services/email_service.py
-from typing import List, Dict, Any, Optional, Union
+from __future__ import annotations
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple, Union
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from email.mime.text import MIMEText
+from email.message import EmailMessage
 from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-import aiosmtplib
-import sendgrid
-from sendgrid.helpers.mail import Mail, Email, To, Content, Attachment, FileContent, FileName, FileType, Disposition
+from email.mime.text import MIMEText
 from datetime import datetime, timedelta
 from bson import ObjectId
-import logging
+from pymongo import ReturnDocument, UpdateOne
 import asyncio
 import base64
-import mimetypes
-from pathlib import Path
 from jinja2 import Template, Environment, BaseLoader
 import re
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.utils.ttl_cache import TTLCache
+
+# The transport SDKs and Redis client are imported where they are first
+# used, so workers that never send email don't pay for loading them
+if TYPE_CHECKING:
+    import aiosmtplib
+    import httpx
+    import redis.asyncio as aioredis
 
 logger = get_logger(__name__)
 
+EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# SendGrid accepts at most this many personalizations per mail/send request
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+
+# Jinja delimiters; content without any of them renders to itself
+TEMPLATE_SYNTAX_REGEX = re.compile(r'\{[{%#]')
+
+# Template variables that differ per recipient
+RECIPIENT_VARS_REGEX = re.compile(r'\b(contact|lead)\s*[.\[]')
+
+# Contact and lead fields exposed to email templates
+TEMPLATE_CONTACT_FIELDS = {"first_name": 1, "last_name": 1, "email": 1, "phone": 1, "company": 1}
+TEMPLATE_LEAD_FIELDS = {"status": 1, "source": 1, "service_type": 1, "estimated_value": 1}
+
+# email_messages fields needed to send a due scheduled email
+SCHEDULED_SEND_FIELDS = {
+    "company_id": 1,
+    "to_email": 1,
+    "from_email": 1,
+    "from_name": 1,
+    "subject": 1,
+    "content": 1,
+    "content_type": 1,
+    "created_at": 1
+}
+
+# Shared by every EmailService instance; templates come from strings so
+# there is nothing on disk to auto-reload
+_jinja_env = Environment(loader=BaseLoader(), auto_reload=False, cache_size=1000)
+
+@lru_cache(maxsize=1024)
+def _compile_template(source: str) -> Template:
+    """Compile email content once and reuse it for every send"""
+    return _jinja_env.from_string(source)
+
+# Company template context (name/phone/email/website), keyed by company_id
+_company_context_cache = TTLCache(maxsize=10_000, ttl=60)
+
+# Company billing_info used for the monthly email limit, keyed by company_id
+_billing_info_cache = TTLCache(maxsize=10_000, ttl=60)
+BILLING_INFO_FIELDS = {"billing_info.monthly_email_limit": 1, "billing_info.monthly_email_used": 1}
+
+# Monthly send counters live in Redis so every worker sees the same count.
+# After a Redis error the check falls back to MongoDB for a short while.
+EMAIL_QUOTA_KEY_TTL = 32 * 24 * 60 * 60
+REDIS_RETRY_SECONDS = 30
+_redis_client: Optional[aioredis.Redis] = None
+_redis_retry_at = 0.0
+
+def _email_quota_key(company_id: str) -> str:
+    """Redis key holding a company's send count for the current month"""
+    return f"email_quota:{company_id}:{datetime.utcnow():%Y%m}"
+
+async def reset_email_usage(db: AsyncIOMotorDatabase, company_id: str) -> None:
+    """Reset a company's monthly email usage in MongoDB and the Redis counter"""
+    from redis.exceptions import RedisError
+    
+    await db.companies.update_one(
+        {"_id": ObjectId(company_id)},
+        {"$set": {"billing_info.monthly_email_used": 0, "updated_at": datetime.utcnow()}}
+    )
+    _billing_info_cache.pop(company_id)
+    try:
+        await _get_redis().delete(_email_quota_key(company_id))
+    except RedisError as e:
+        logger.warning(f"⚠️ Could not clear Redis email quota for {company_id}: {e}")
+
+def _get_redis() -> aioredis.Redis:
+    """Return the shared Redis client, creating it on first use"""
+    global _redis_client
+    if _redis_client is None:
+        import redis.asyncio as aioredis
+        
+        _redis_client = aioredis.from_url(
+            settings.get_redis_url(),
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_connect_timeout=1,
+            socket_timeout=1
+        )
+    return _redis_client
+
+# One pooled HTTP client for the SendGrid v3 API, shared by every
+# EmailService instance so sends reuse open TLS connections
+SENDGRID_API_URL = "https://api.sendgrid.com"
+_sendgrid_http: Optional[httpx.AsyncClient] = None
+
+def _get_sendgrid_http() -> httpx.AsyncClient:
+    """Return the shared SendGrid HTTP client, creating it on first use"""
+    global _sendgrid_http
+    if _sendgrid_http is None:
+        import httpx
+        
+        _sendgrid_http = httpx.AsyncClient(
+            base_url=SENDGRID_API_URL,
+            headers={"Authorization": f"Bearer {settings.SENDGRID_API_KEY}"},
+            timeout=30,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100)
+        )
+    return _sendgrid_http
+
+async def close_email_clients() -> None:
+    """Flush pending usage counts and close the shared clients on shutdown"""
+    global _sendgrid_http, _redis_client
+    await _write_buffer.close()
+    await _booking_smtp_pool.close()
+    await _smtp_pool.close()
+    if _sendgrid_http is not None:
+        await _sendgrid_http.aclose()
+        _sendgrid_http = None
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
+
+def _add_attachment(msg: EmailMessage, attachment: Dict[str, Any]) -> None:
+    """Attach base64 text or raw bytes to msg"""
+    content = attachment["content"]
+    if isinstance(content, str):
+        content = base64.b64decode(content)
+    msg.add_attachment(
+        content,
+        maintype="application",
+        subtype="octet-stream",
+        filename=attachment["filename"]
+    )
+
+def _rollup_day(when: datetime) -> datetime:
+    """Truncate a timestamp to the start of its UTC day"""
+    return datetime(when.year, when.month, when.day)
+
+async def _none() -> None:
+    """Placeholder awaitable for optional lookups in asyncio.gather"""
+    return None
+
+class TokenBucket:
+    """Async token-bucket rate limiter.
+    
+    Allows bursts of up to capacity sends, refilled at refill_rate tokens
+    per second; callers wait only when the bucket is empty.
+    """
+    
+    def __init__(self, capacity: int, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = float(capacity)
+        self.last_refill: Optional[float] = None
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, n: int = 1) -> None:
+        """Wait until n tokens are available and take them"""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.last_refill is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+                self.last_refill = now
+                
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                
+                await asyncio.sleep((n - self.tokens) / self.refill_rate)
+
+# Provider quotas are per account, so the buckets are shared by every
+# EmailService instance in the process
+_sendgrid_bucket = TokenBucket(settings.SENDGRID_RATE_BURST, settings.SENDGRID_RATE_PER_SECOND)
+_smtp_bucket = TokenBucket(settings.SMTP_RATE_BURST, settings.SMTP_RATE_PER_SECOND)
+
+class WriteBuffer:
+    """Coalesces $set/$inc updates per document into periodic bulk writes.
+    
+    A blast to thousands of recipients would otherwise update the same
+    company document once per send, and each tracking hit would write its
+    contact separately. Updates are folded per (collection, _id), held for
+    up to interval seconds and written with one bulk_write per collection.
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending: Dict[str, Dict[ObjectId, Dict[str, Dict[str, Any]]]] = defaultdict(dict)
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._flush_task: Optional[asyncio.Task] = None
+    
+    def add(
+        self,
+        db: AsyncIOMotorDatabase,
+        collection: str,
+        doc_id: ObjectId,
+        set_fields: Optional[Dict[str, Any]] = None,
+        inc_fields: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Fold an update into the buffer and schedule a flush.
+        
+        Later $set values win; $inc amounts are summed.
+        """
+        self._db = db
+        self._merge(collection, doc_id, {"$set": set_fields or {}, "$inc": inc_fields or {}})
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+    
+    def _merge(self, collection: str, doc_id: ObjectId, update: Dict[str, Dict[str, Any]]) -> None:
+        pending = self._pending[collection].setdefault(doc_id, {"$set": {}, "$inc": {}})
+        pending["$set"].update(update["$set"])
+        for field, amount in update["$inc"].items():
+            pending["$inc"][field] = pending["$inc"].get(field, 0) + amount
+    
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        await self.flush()
+    
+    async def flush(self) -> None:
+        """Write all pending updates"""
+        if not self._pending or self._db is None:
+            return
+        
+        drained, self._pending = self._pending, defaultdict(dict)
+        for collection, updates in drained.items():
+            try:
+                await self._db[collection].bulk_write([
+                    UpdateOne({"_id": doc_id}, {op: fields for op, fields in update.items() if fields})
+                    for doc_id, update in updates.items()
+                ], ordered=False)
+            except asyncio.CancelledError:
+                for pending_collection, pending_updates in drained.items():
+                    for doc_id, update in pending_updates.items():
+                        self._merge(pending_collection, doc_id, update)
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error flushing buffered {collection} updates: {e}")
+    
+    async def close(self) -> None:
+        """Cancel the pending timer and write whatever is left"""
+        task = self._flush_task
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+WRITE_FLUSH_INTERVAL = 0.5
+_write_buffer = WriteBuffer(WRITE_FLUSH_INTERVAL)
+
+class SMTPPool:
+    """Pool of connected, logged-in aiosmtplib sessions.
+    
+    Sessions are opened on demand up to max_size and handed back after
+    each send, so STARTTLS and AUTH happen once per session rather than
+    once per message.
+    """
+    
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str],
+        password: Optional[str],
+        max_size: int = 10,
+        use_tls: bool = False,
+        start_tls: Optional[bool] = True
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._size = 0
+    
+    async def _connect(self) -> aiosmtplib.SMTP:
+        import aiosmtplib
+        
+        logger.info(f"📧 Connecting to SMTP: {self.hostname}:{self.port}")
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls
+        )
+        await smtp.connect()
+        if self.username and self.password:
+            await smtp.login(self.username, self.password)
+        return smtp
+    
+    async def _checkout(self) -> aiosmtplib.SMTP:
+        while True:
+            try:
+                smtp = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                if self._size < self.max_size:
+                    self._size += 1
+                    try:
+                        return await self._connect()
+                    except BaseException:
+                        self._size -= 1
+                        raise
+                smtp = await self._idle.get()
+            
+            if smtp.is_connected:
+                return smtp
+            self._size -= 1
+    
+    def _discard(self, smtp: aiosmtplib.SMTP) -> None:
+        self._size -= 1
+        smtp.close()
+    
+    @asynccontextmanager
+    async def acquire(self):
+        """Borrow a session; broken sessions are dropped instead of returned"""
+        smtp = await self._checkout()
+        try:
+            yield smtp
+        except BaseException:
+            self._discard(smtp)
+            raise
+        if smtp.is_connected:
+            self._idle.put_nowait(smtp)
+        else:
+            self._discard(smtp)
+    
+    async def close(self) -> None:
+        """Quit every idle session"""
+        while not self._idle.empty():
+            smtp = self._idle.get_nowait()
+            self._size -= 1
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
+# Sessions for booking confirmations, which send from the EMAIL_* account
+_booking_smtp_pool = SMTPPool(
+    settings.EMAIL_HOST,
+    settings.EMAIL_PORT,
+    settings.EMAIL_USER,
+    settings.EMAIL_PASSWORD
+)
+
+# Sessions for campaign, bulk and scheduled sends through the SMTP_* server
+_smtp_pool = SMTPPool(
+    settings.SMTP_HOST,
+    settings.SMTP_PORT,
+    settings.SMTP_USER,
+    settings.SMTP_PASSWORD,
+    use_tls=settings.SMTP_TLS,
+    start_tls=None
+)
+
+# Booking confirmation body, compiled once; only the booking details
+# change between sends
+BOOKING_CONFIRMATION_TEMPLATE = _jinja_env.from_string("""
+            <html>
+            <body style="font-family: Arial, sans-serif; padding: 20px;">
+                <h2 style="color: #4F46E5;">🎉 Booking Confirmed!</h2>
+
+                <p>Dear {{ customer_name }},</p>
+
+                <p>Great news! Your booking has been confirmed by our team.</p>
+
+                <div style="background: #f0f9ff; padding: 20px; border-left: 4px solid #4F46E5; margin: 20px 0;">
+                    <h3 style="margin-top: 0;">Booking Details</h3>
+                    <p><strong>Service:</strong> {{ service_type }}</p>
+                    <p><strong>Location:</strong> {{ location }}</p>
+                    <p><strong>Time:</strong> {{ scheduled_time }}</p>
+                    <p><strong>Booking ID:</strong> {{ booking_id }}</p>
+                    {% if admin_notes %}<div style="margin-top: 15px; padding: 10px; background: #FEF3C7; border-radius: 4px;"><strong>Admin Note:</strong> {{ admin_notes }}</div>{% endif %}
+                </div>
+
+                <p>Our team will contact you within 24 hours to finalize details.</p>
+
+                <p>Best regards,<br><strong>Your Service Team</strong></p>
+            </body>
+            </html>
+            """)
+
+BOOKING_FROM_HEADER = f"Service Team <{settings.EMAIL_USER}>"
+
 class EmailService:
     """Email service for sending and managing emails"""
     
     def __init__(self, database: AsyncIOMotorDatabase):
         self.db = database
         self.sendgrid_client = None
-        self.jinja_env = Environment(loader=BaseLoader())
+        self.jinja_env = _jinja_env
         self._initialize_clients()
     
     def _initialize_clients(self) -> None:
@@ -37,7 +422,7 @@ class EmailService:
         try:
             # Initialize SendGrid if configured
             if settings.SENDGRID_API_KEY:
-                self.sendgrid_client = sendgrid.SendGridAPIClient(api_key=settings.SENDGRID_API_KEY)
+                self.sendgrid_client = _get_sendgrid_http()
                 logger.info("✅ SendGrid email client initialized successfully")
             elif settings.SMTP_HOST and settings.SMTP_USER and settings.SMTP_PASSWORD:
                 logger.info("✅ SMTP email configuration available")
@@ -64,16 +449,110 @@ class EmailService:
         scheduled_at: Optional[datetime] = None,
         reply_to: Optional[str] = None,
         cc: Optional[List[str]] = None,
-        bcc: Optional[List[str]] = None
+        bcc: Optional[List[str]] = None,
+        smtp: Optional[SMTPPool] = None,
+        skip_template: bool = False
     ) -> Dict[str, Any]:
-        """Send email message"""
+        """Send email message and record it"""
+        email_data = await self._send_email_core(
+            to_email=to_email,
+            subject=subject,
+            content=content,
+            company_id=company_id,
+            from_email=from_email,
+            from_name=from_name,
+            content_type=content_type,
+            contact_id=contact_id,
+            lead_id=lead_id,
+            campaign_id=campaign_id,
+            template_id=template_id,
+            user_id=user_id,
+            attachments=attachments,
+            scheduled_at=scheduled_at,
+            reply_to=reply_to,
+            cc=cc,
+            bcc=bcc,
+            smtp=smtp,
+            skip_template=skip_template
+        )
+        
+        # The message insert and the usage/contact/lead bookkeeping are
+        # independent writes, so issue them together
+        writes = [
+            self.db.email_messages.insert_one(email_data),
+            self._increment_daily_rollup(
+                company_id, email_data["created_at"], {f"status.{email_data['status']}": 1}
+            )
+        ]
+        
+        # Update company email usage
+        if email_data["status"] == "sent":
+            writes.append(self._increment_email_usage(company_id))
+        
+        # Update contact last contact timestamp
+        if contact_id:
+            writes.append(self._update_contact_last_contact(contact_id, "email"))
+        
+        # Update lead communication tracking
+        if lead_id:
+            writes.append(self._update_lead_communication(lead_id, "email"))
+        
         try:
+            result, *_ = await asyncio.gather(*writes)
+        except Exception as e:
+            logger.error(f"❌ Error storing email to {to_email}: {e}")
+            raise
+        
+        return {
+            "id": str(result.inserted_id),
+            "to_email": to_email,
+            "subject": subject,
+            "status": email_data["status"],
+            "email_id": email_data["email_id"],
+            "created_at": email_data["created_at"],
+            "character_count": email_data["metadata"]["character_count"]
+        }
+    
+    async def _send_email_core(
+        self,
+        to_email: str,
+        subject: str,
+        content: str,
+        company_id: str,
+        from_email: Optional[str] = None,
+        from_name: Optional[str] = None,
+        content_type: str = "html",
+        contact_id: Optional[str] = None,
+        lead_id: Optional[str] = None,
+        campaign_id: Optional[str] = None,
+        template_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        attachments: Optional[List[Dict[str, Any]]] = None,
+        scheduled_at: Optional[datetime] = None,
+        reply_to: Optional[str] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+        smtp: Optional[SMTPPool] = None,
+        skip_template: bool = False
+    ) -> Dict[str, Any]:
+        """Validate, render and send one email, returning its unsaved record.
+        
+        smtp is the session pool from _smtp_connection; bulk sends pass it
+        in so messages reuse open connections.
+        skip_template marks content that has already been rendered.
+        """
+        # Quota reserved for this send; handed back unless the email goes out
+        reserved = 0
+        try:
+            now = datetime.utcnow()
+            
             # Validate email address
             if not self._validate_email(to_email):
                 raise ValueError(f"Invalid email address: {to_email}")
             
             # Check company email limits
-            if not await self._check_email_limits(company_id):
+            allowed, reserved = await self._check_email_limits(company_id)
+            if not allowed:
                 raise ValueError("Email limit exceeded for this month")
             
             # Set default from email/name
@@ -83,22 +562,25 @@ class EmailService:
                 from_name = settings.EMAILS_FROM_NAME or "CRM System"
             
             # Validate content
-            if not content or len(content.strip()) == 0:
+            if not content or content.isspace():
                 raise ValueError("Email content cannot be empty")
             
             # Process template variables if needed
-            processed_content = await self._process_template_variables(
-                content,
-                company_id,
-                contact_id,
-                lead_id
-            )
+            if skip_template:
+                processed_content = content
+            else:
+                processed_content = await self._process_template_variables(
+                    content,
+                    company_id,
+                    contact_id,
+                    lead_id
+                )
             
             # Send email if not scheduled
             email_id = None
             status = "queued"
             
-            if not scheduled_at or scheduled_at <= datetime.utcnow():
+            if not scheduled_at or scheduled_at <= now:
                 if self.sendgrid_client:
                     email_id = await self._send_via_sendgrid(
                         to_email=to_email,
@@ -124,7 +606,8 @@ class EmailService:
                         attachments=attachments,
                         reply_to=reply_to,
                         cc=cc,
-                        bcc=bcc
+                        bcc=bcc,
+                        smtp=smtp
                     )
                     status = "sent"
                 else:
@@ -133,74 +616,117 @@ class EmailService:
             else:
                 status = "scheduled"
             
-            # Store in database
-            email_data = {
-                "company_id": ObjectId(company_id),
-                "contact_id": ObjectId(contact_id) if contact_id else None,
-                "lead_id": ObjectId(lead_id) if lead_id else None,
-                "campaign_id": ObjectId(campaign_id) if campaign_id else None,
-                "to_email": to_email,
-                "from_email": from_email,
-                "from_name": from_name,
-                "subject": subject,
-                "content": processed_content,
-                "content_type": content_type,
-                "status": status,
-                "email_id": email_id,  # SendGrid message ID
-                "template_id": template_id,
-                "sent_by": ObjectId(user_id) if user_id else None,
-                "scheduled_at": scheduled_at,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
-                "metadata": {
-                    "character_count": len(processed_content),
-                    "has_attachments": bool(attachments),
-                    "attachment_count": len(attachments) if attachments else 0
-                },
-                "tracking": {
-                    "opens": 0,
-                    "clicks": 0,
-                    "bounced": False,
-                    "spam_reported": False
-                }
-            }
-            
-            # Add CC/BCC if provided
-            if cc:
-                email_data["cc"] = cc
-            if bcc:
-                email_data["bcc"] = bcc
-            if reply_to:
-                email_data["reply_to"] = reply_to
-            
-            result = await self.db.email_messages.insert_one(email_data)
-            
-            # Update company email usage
-            if status == "sent":
-                await self._increment_email_usage(company_id)
+            # Only sent emails count; scheduled ones are counted when they go out
+            if status != "sent":
+                await self._release_email_quota(company_id, reserved)
+            reserved = 0
             
-            # Update contact last contact timestamp
-            if contact_id:
-                await self._update_contact_last_contact(contact_id, "email")
-            
-            # Update lead communication tracking
-            if lead_id:
-                await self._update_lead_communication(lead_id, "email")
+            # Store in database
+            email_data = self._build_email_record(
+                company_id=company_id,
+                to_email=to_email,
+                subject=subject,
+                content=processed_content,
+                from_email=from_email,
+                from_name=from_name,
+                content_type=content_type,
+                status=status,
+                email_id=email_id,
+                contact_id=contact_id,
+                lead_id=lead_id,
+                campaign_id=campaign_id,
+                template_id=template_id,
+                user_id=user_id,
+                attachments=attachments,
+                scheduled_at=scheduled_at,
+                reply_to=reply_to,
+                cc=cc,
+                bcc=bcc,
+                now=now
+            )
             
-            return {
-                "id": str(result.inserted_id),
-                "to_email": to_email,
-                "subject": subject,
-                "status": status,
-                "email_id": email_id,
-                "created_at": email_data["created_at"],
-                "character_count": len(processed_content)
-            }
+            return email_data
             
         except Exception as e:
             logger.error(f"❌ Error sending email to {to_email}: {e}")
+            await self._release_email_quota(company_id, reserved)
+            raise
+        except asyncio.CancelledError:
+            # A cancelled send never went out either
+            await self._release_email_quota(company_id, reserved)
             raise
     
+    def _build_email_record(
+        self,
+        company_id: str,
+        to_email: str,
+        subject: str,
+        content: str,
+        from_email: str,
+        from_name: str,
+        content_type: str,
+        status: str,
+        email_id: Optional[str] = None,
+        contact_id: Optional[str] = None,
+        lead_id: Optional[str] = None,
+        campaign_id: Optional[str] = None,
+        template_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        attachments: Optional[List[Dict[str, Any]]] = None,
+        scheduled_at: Optional[datetime] = None,
+        reply_to: Optional[str] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+        now: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Build the email_messages document for one recipient"""
+        now = now or datetime.utcnow()
+        attachment_count = len(attachments) if attachments else 0
+        email_data = {
+            "company_id": ObjectId(company_id),
+            "contact_id": ObjectId(contact_id) if contact_id else None,
+            "lead_id": ObjectId(lead_id) if lead_id else None,
+            "campaign_id": ObjectId(campaign_id) if campaign_id else None,
+            "to_email": to_email,
+            "from_email": from_email,
+            "from_name": from_name,
+            "subject": subject,
+            "content": content,
+            "content_type": content_type,
+            "status": status,
+            "email_id": email_id,  # SendGrid message ID
+            "template_id": template_id,
+            "sent_by": ObjectId(user_id) if user_id else None,
+            "scheduled_at": scheduled_at,
+            "created_at": now,
+            "updated_at": now,
+            "metadata": {
+                "character_count": len(content),
+                "has_attachments": attachment_count > 0,
+                "attachment_count": attachment_count
+            },
+            "tracking": {
+                "opens": 0,
+                "clicks": 0,
+                "bounced": False,
+                "spam_reported": False
+            }
+        }
+        
+        # Add CC/BCC if provided
+        if cc:
+            email_data["cc"] = cc
+        if bcc:
+            email_data["bcc"] = bcc
+        if reply_to:
+            email_data["reply_to"] = reply_to
+        
+        return email_data
+    
+    def _has_recipient_vars(self, content: str) -> bool:
+        """Check whether content references per-recipient template variables"""
+        return RECIPIENT_VARS_REGEX.search(content) is not None
+    
     async def send_bulk_email(
         self,
         recipients: List[Dict[str, Any]],  # [{"email": "...", "name": "...", "contact_id": "..."}]
@@ -212,10 +738,13 @@ class EmailService:
         user_id: Optional[str] = None,
         campaign_id: Optional[str] = None,
         template_id: Optional[str] = None,
-        batch_size: int = 50,
-        delay_seconds: int = 1
+        batch_size: int = 50
     ) -> Dict[str, Any]:
-        """Send email to multiple recipients"""
+        """Send email to multiple recipients.
+        
+        Throughput is paced by the provider token buckets rather than fixed
+        pauses between batches.
+        """
         try:
             results = {
                 "total": len(recipients),
@@ -224,43 +753,97 @@ class EmailService:
                 "errors": []
             }
             
-            # Process in batches to avoid rate limits
-            for i in range(0, len(recipients), batch_size):
-                batch = recipients[i:i + batch_size]
-                
-                # Send batch
-                tasks = []
-                for recipient in batch:
-                    task = self.send_email(
-                        to_email=recipient["email"],
-                        subject=subject,
-                        content=content,
-                        company_id=company_id,
-                        from_email=from_email,
-                        from_name=from_name,
-                        user_id=user_id,
-                        contact_id=recipient.get("contact_id"),
-                        campaign_id=campaign_id,
-                        template_id=template_id
-                    )
-                    tasks.append(task)
-                
-                # Execute batch
-                batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                for j, result in enumerate(batch_results):
-                    if isinstance(result, Exception):
+            # Identical content for everyone goes out as multi-recipient
+            # SendGrid requests instead of one request per recipient
+            if self.sendgrid_client and not self._has_recipient_vars(content):
+                await self._send_bulk_via_sendgrid(
+                    recipients=recipients,
+                    subject=subject,
+                    content=content,
+                    company_id=company_id,
+                    from_email=from_email,
+                    from_name=from_name,
+                    user_id=user_id,
+                    campaign_id=campaign_id,
+                    template_id=template_id,
+                    results=results
+                )
+                logger.info(f"📧 Bulk email completed - Sent: {results['sent']}, Failed: {results['failed']}")
+                return results
+            
+            skip_template = False
+            rendered_by_contact: Dict[str, str] = {}
+            if content and not content.isspace():
+                if not self._has_recipient_vars(content):
+                    # Content without per-recipient variables renders the
+                    # same for everyone, so render it once up front
+                    content = await self._process_template_variables(content, company_id)
+                    skip_template = True
+                else:
+                    # Per-recipient content: load every contact in one query
+                    contact_ids = [str(r["contact_id"]) for r in recipients if r.get("contact_id")]
+                    if contact_ids:
+                        rendered_by_contact = await self._process_template_variables_bulk(
+                            content, company_id, contact_ids
+                        )
+            
+            # Keep up to batch_size sends in flight; a slow recipient no
+            # longer holds back the rest of its batch
+            semaphore = asyncio.Semaphore(batch_size)
+            pending_records: List[Dict[str, Any]] = []
+            
+            async def _flush_records() -> None:
+                records = pending_records[:]
+                pending_records.clear()
+                if not records:
+                    return
+                try:
+                    # Store the records in one round-trip
+                    await self._store_sent_records(company_id, records)
+                except Exception as e:
+                    # Runs inside the TaskGroup, so raising would cancel the
+                    # remaining sends; count the batch as failed instead
+                    logger.error(f"❌ Error storing bulk email records: {e}")
+                    results["failed"] += len(records)
+                    results["errors"].extend({"email": r["to_email"], "error": str(e)} for r in records)
+                    return
+                results["sent"] += len(records)
+            
+            async def _send_one(recipient: Dict[str, Any], smtp: Optional[SMTPPool]) -> None:
+                rendered = rendered_by_contact.get(str(recipient.get("contact_id")))
+                async with semaphore:
+                    try:
+                        record = await self._send_email_core(
+                            to_email=recipient["email"],
+                            subject=subject,
+                            content=rendered if rendered is not None else content,
+                            company_id=company_id,
+                            from_email=from_email,
+                            from_name=from_name,
+                            user_id=user_id,
+                            contact_id=recipient.get("contact_id"),
+                            campaign_id=campaign_id,
+                            template_id=template_id,
+                            smtp=smtp,
+                            skip_template=skip_template or rendered is not None
+                        )
+                    except Exception as e:
                         results["failed"] += 1
                         results["errors"].append({
-                            "email": batch[j]["email"],
-                            "error": str(result)
+                            "email": recipient["email"],
+                            "error": str(e)
                         })
-                    else:
-                        results["sent"] += 1
+                        return
                 
-                # Add delay between batches
-                if i + batch_size < len(recipients):
-                    await asyncio.sleep(delay_seconds)
+                pending_records.append(record)
+                if len(pending_records) >= batch_size:
+                    await _flush_records()
+            
+            async with self._smtp_connection() as smtp:
+                async with asyncio.TaskGroup() as tg:
+                    for recipient in recipients:
+                        tg.create_task(_send_one(recipient, smtp))
+            await _flush_records()
             
             logger.info(f"📧 Bulk email completed - Sent: {results['sent']}, Failed: {results['failed']}")
             return results
@@ -269,6 +852,112 @@ class EmailService:
             logger.error(f"❌ Error sending bulk email: {e}")
             raise
     
+    async def _send_bulk_via_sendgrid(
+        self,
+        recipients: List[Dict[str, Any]],
+        subject: str,
+        content: str,
+        company_id: str,
+        from_email: Optional[str],
+        from_name: Optional[str],
+        user_id: Optional[str],
+        campaign_id: Optional[str],
+        template_id: Optional[str],
+        results: Dict[str, Any]
+    ) -> None:
+        """Send shared content to recipients in SendGrid batches, updating results"""
+        def _fail(batch: List[Dict[str, Any]], error: str) -> None:
+            results["failed"] += len(batch)
+            results["errors"].extend({"email": r["email"], "error": error} for r in batch)
+        
+        if not content or content.isspace():
+            _fail(recipients, "Email content cannot be empty")
+            return
+        
+        from_email = from_email or settings.EMAILS_FROM_EMAIL or "noreply@company.com"
+        from_name = from_name or settings.EMAILS_FROM_NAME or "CRM System"
+        
+        valid = []
+        for recipient in recipients:
+            if self._validate_email(recipient["email"]):
+                valid.append(recipient)
+            else:
+                _fail([recipient], f"Invalid email address: {recipient['email']}")
+        
+        # No per-recipient variables, so render once for the whole send
+        processed_content = await self._process_template_variables(content, company_id)
+        
+        for i in range(0, len(valid), SENDGRID_MAX_PERSONALIZATIONS):
+            batch = valid[i:i + SENDGRID_MAX_PERSONALIZATIONS]
+            
+            allowed, reserved = await self._check_email_limits(company_id, len(batch))
+            if not allowed:
+                _fail(batch, "Email limit exceeded for this month")
+                continue
+            
+            try:
+                email_id = await self._send_via_sendgrid_bulk(
+                    recipients=batch,
+                    subject=subject,
+                    content=processed_content,
+                    from_email=from_email,
+                    from_name=from_name
+                )
+            except Exception as e:
+                await self._release_email_quota(company_id, reserved)
+                _fail(batch, str(e))
+                continue
+            
+            now = datetime.utcnow()
+            records = [
+                self._build_email_record(
+                    company_id=company_id,
+                    to_email=r["email"],
+                    subject=subject,
+                    content=processed_content,
+                    from_email=from_email,
+                    from_name=from_name,
+                    content_type="html",
+                    status="sent",
+                    email_id=email_id,
+                    contact_id=r.get("contact_id"),
+                    campaign_id=campaign_id,
+                    template_id=template_id,
+                    user_id=user_id,
+                    now=now
+                )
+                for r in batch
+            ]
+            try:
+                await self._store_sent_records(company_id, records)
+            except Exception as e:
+                # The batch went out, but keep sending the remaining batches
+                logger.error(f"❌ Error storing SendGrid bulk records: {e}")
+                _fail(batch, str(e))
+                continue
+            results["sent"] += len(batch)
+    
+    async def _store_sent_records(self, company_id: str, records: List[Dict[str, Any]]) -> None:
+        """Insert bulk-send records and apply their usage/contact updates"""
+        rollups = defaultdict(Counter)
+        for r in records:
+            rollups[(company_id, _rollup_day(r["created_at"]))][f"status.{r['status']}"] += 1
+        
+        writes = [
+            self.db.email_messages.insert_many(records, ordered=False),
+            self._increment_daily_rollups(rollups)
+        ]
+        
+        sent_count = sum(1 for r in records if r["status"] == "sent")
+        if sent_count:
+            writes.append(self._increment_email_usage(company_id, sent_count))
+        
+        contact_ids = [str(r["contact_id"]) for r in records if r.get("contact_id")]
+        if contact_ids:
+            writes.append(self._update_contacts_last_contact(contact_ids, "email"))
+        
+        await asyncio.gather(*writes)
+    
     async def track_email_open(
         self,
         email_id: str,
@@ -277,32 +966,36 @@ class EmailService:
     ) -> bool:
         """Track email open event"""
         try:
-            result = await self.db.email_messages.update_one(
+            now = datetime.utcnow()
+            email_doc = await self.db.email_messages.find_one_and_update(
                 {"_id": ObjectId(email_id)},
                 {
                     "$inc": {"tracking.opens": 1},
                     "$set": {
-                        "tracking.first_opened_at": datetime.utcnow(),
-                        "tracking.last_opened_at": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
+                        "tracking.first_opened_at": now,
+                        "tracking.last_opened_at": now,
+                        "updated_at": now
                     },
                     "$push": {
                         "tracking.open_events": {
-                            "timestamp": datetime.utcnow(),
+                            "timestamp": now,
                             "user_agent": user_agent,
                             "ip_address": ip_address
                         }
                     }
-                }
+                },
+                projection={"company_id": 1, "contact_id": 1, "created_at": 1},
+                return_document=ReturnDocument.AFTER
             )
             
-            if result.modified_count > 0:
+            if email_doc:
+                await self._increment_daily_rollup(email_doc["company_id"], email_doc["created_at"], {"opens": 1})
+            
+            if email_doc and email_doc.get("contact_id"):
                 # Update contact engagement score
-                email_doc = await self.db.email_messages.find_one({"_id": ObjectId(email_id)})
-                if email_doc and email_doc.get("contact_id"):
-                    await self._update_contact_engagement(str(email_doc["contact_id"]), "email_opened")
+                await self._update_contact_engagement(str(email_doc["contact_id"]), "email_opened")
             
-            return result.modified_count > 0
+            return email_doc is not None
             
         except Exception as e:
             logger.error(f"❌ Error tracking email open: {e}")
@@ -318,33 +1011,37 @@ class EmailService:
     ) -> bool:
         """Track email click event"""
         try:
-            result = await self.db.email_messages.update_one(
+            now = datetime.utcnow()
+            email_doc = await self.db.email_messages.find_one_and_update(
                 {"_id": ObjectId(email_id)},
                 {
                     "$inc": {"tracking.clicks": 1},
                     "$set": {
-                        "tracking.first_clicked_at": datetime.utcnow(),
-                        "tracking.last_clicked_at": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
+                        "tracking.first_clicked_at": now,
+                        "tracking.last_clicked_at": now,
+                        "updated_at": now
                     },
                     "$push": {
                         "tracking.click_events": {
-                            "timestamp": datetime.utcnow(),
+                            "timestamp": now,
                             "url": url,
                             "user_agent": user_agent,
                             "ip_address": ip_address
                         }
                     }
-                }
+                },
+                projection={"company_id": 1, "contact_id": 1, "created_at": 1},
+                return_document=ReturnDocument.AFTER
             )
             
-            if result.modified_count > 0:
+            if email_doc:
+                await self._increment_daily_rollup(email_doc["company_id"], email_doc["created_at"], {"clicks": 1})
+            
+            if email_doc and email_doc.get("contact_id"):
                 # Update contact engagement score
-                email_doc = await self.db.email_messages.find_one({"_id": ObjectId(email_id)})
-                if email_doc and email_doc.get("contact_id"):
-                    await self._update_contact_engagement(str(email_doc["contact_id"]), "email_clicked")
+                await self._update_contact_engagement(str(email_doc["contact_id"]), "email_clicked")
             
-            return result.modified_count > 0
+            return email_doc is not None
             
         except Exception as e:
             logger.error(f"❌ Error tracking email click: {e}")
@@ -358,7 +1055,8 @@ class EmailService:
     ) -> bool:
         """Handle email bounce"""
         try:
-            result = await self.db.email_messages.update_one(
+            now = datetime.utcnow()
+            email_doc = await self.db.email_messages.find_one_and_update(
                 {"_id": ObjectId(email_id)},
                 {
                     "$set": {
@@ -366,24 +1064,42 @@ class EmailService:
                         "tracking.bounced": True,
                         "tracking.bounce_type": bounce_type,
                         "tracking.bounce_reason": bounce_reason,
-                        "tracking.bounced_at": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
+                        "tracking.bounced_at": now,
+                        "updated_at": now
                     }
-                }
+                },
+                # The previous status is needed to move the message between
+                # rollup buckets; the projected fields are not modified
+                projection={
+                    "company_id": 1,
+                    "contact_id": 1,
+                    "to_email": 1,
+                    "status": 1,
+                    "created_at": 1,
+                    "tracking.bounced": 1
+                },
+                return_document=ReturnDocument.BEFORE
             )
             
-            if result.modified_count > 0:
+            if email_doc:
+                increments = Counter()
+                if email_doc.get("status") != "bounced":
+                    increments[f"status.{email_doc.get('status')}"] -= 1
+                    increments["status.bounced"] += 1
+                if not email_doc.get("tracking", {}).get("bounced"):
+                    increments["bounced"] += 1
+                await self._increment_daily_rollup(email_doc["company_id"], email_doc["created_at"], increments)
+            
+            if email_doc and email_doc.get("contact_id"):
                 # Update contact email bounce status
-                email_doc = await self.db.email_messages.find_one({"_id": ObjectId(email_id)})
-                if email_doc and email_doc.get("contact_id"):
-                    await self._handle_contact_bounce(
-                        str(email_doc["contact_id"]),
-                        email_doc["to_email"],
-                        bounce_type,
-                        bounce_reason
-                    )
+                await self._handle_contact_bounce(
+                    str(email_doc["contact_id"]),
+                    email_doc["to_email"],
+                    bounce_type,
+                    bounce_reason
+                )
             
-            return result.modified_count > 0
+            return email_doc is not None
             
         except Exception as e:
             logger.error(f"❌ Error handling email bounce: {e}")
@@ -397,32 +1113,21 @@ class EmailService:
     ) -> Dict[str, Any]:
         """Get email analytics for a company"""
         try:
+            now = datetime.utcnow()
             if not start_date:
-                start_date = datetime.utcnow() - timedelta(days=30)
+                start_date = now - timedelta(days=30)
             if not end_date:
-                end_date = datetime.utcnow()
+                end_date = now
             
-            pipeline = [
+            # Read the per-day counters kept by the send/tracking paths
+            # instead of scanning every message in the window
+            rollups = await self.db.email_analytics_daily.find(
                 {
-                    "$match": {
-                        "company_id": ObjectId(company_id),
-                        "created_at": {"$gte": start_date, "$lte": end_date}
-                    }
+                    "company_id": ObjectId(company_id),
+                    "day": {"$gte": _rollup_day(start_date), "$lte": _rollup_day(end_date)}
                 },
-                {
-                    "$group": {
-                        "_id": "$status",
-                        "count": {"$sum": 1},
-                        "total_opens": {"$sum": "$tracking.opens"},
-                        "total_clicks": {"$sum": "$tracking.clicks"},
-                        "bounced_count": {
-                            "$sum": {"$cond": ["$tracking.bounced", 1, 0]}
-                        }
-                    }
-                }
-            ]
-            
-            results = await self.db.email_messages.aggregate(pipeline).to_list(length=None)
+                {"_id": 0, "status": 1, "opens": 1, "clicks": 1, "bounced": 1}
+            ).to_list(length=None)
             
             analytics = {
                 "total_sent": 0,
@@ -441,14 +1146,18 @@ class EmailService:
                 }
             }
             
-            for result in results:
-                status = result["_id"]
-                count = result["count"]
+            by_status = Counter()
+            for rollup in rollups:
+                by_status.update(rollup.get("status", {}))
+                analytics["total_opens"] += rollup.get("opens", 0)
+                analytics["total_clicks"] += rollup.get("clicks", 0)
+                analytics["total_bounced"] += rollup.get("bounced", 0)
+            
+            for status, count in by_status.items():
+                if count <= 0:
+                    continue
                 
                 analytics["by_status"][status] = count
-                analytics["total_opens"] += result["total_opens"]
-                analytics["total_clicks"] += result["total_clicks"]
-                analytics["total_bounced"] += result["bounced_count"]
                 
                 if status in ["sent", "delivered"]:
                     analytics["total_sent"] += count
@@ -483,6 +1192,7 @@ class EmailService:
     ) -> Dict[str, Any]:
         """Create email template"""
         try:
+            now = datetime.utcnow()
             template_data = {
                 "company_id": ObjectId(company_id),
                 "name": name,
@@ -493,8 +1203,8 @@ class EmailService:
                 "variables": variables or [],
                 "is_active": True,
                 "usage_count": 0,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
+                "created_at": now,
+                "updated_at": now
             }
             
             result = await self.db.email_templates.insert_one(template_data)
@@ -545,84 +1255,37 @@ class EmailService:
                 "scheduled_at": {"$lte": now}
             }
             
-            scheduled_emails = await self.db.email_messages.find(query).limit(100).to_list(length=100)
-            
             results = {
                 "processed": 0,
                 "failed": 0,
                 "errors": []
             }
             
-            for email in scheduled_emails:
-                try:
-                    # Send the email
-                    if self.sendgrid_client:
-                        email_id = await self._send_via_sendgrid(
-                            to_email=email["to_email"],
-                            subject=email["subject"],
-                            content=email["content"],
-                            from_email=email["from_email"],
-                            from_name=email["from_name"],
-                            content_type=email["content_type"]
-                        )
-                        
-                        # Update email status
-                        await self.db.email_messages.update_one(
-                            {"_id": email["_id"]},
-                            {
-                                "$set": {
-                                    "status": "sent",
-                                    "email_id": email_id,
-                                    "updated_at": now
-                                }
-                            }
-                        )
-                    elif settings.SMTP_HOST:
-                        await self._send_via_smtp(
-                            to_email=email["to_email"],
-                            subject=email["subject"],
-                            content=email["content"],
-                            from_email=email["from_email"],
-                            from_name=email["from_name"],
-                            content_type=email["content_type"]
-                        )
-                        
-                        # Update email status
-                        await self.db.email_messages.update_one(
-                            {"_id": email["_id"]},
-                            {
-                                "$set": {
-                                    "status": "sent",
-                                    "updated_at": now
-                                }
-                            }
-                        )
-                    
-                    # Update company usage
-                    await self._increment_email_usage(str(email["company_id"]))
-                    
-                    results["processed"] += 1
-                    logger.info(f"📧 Sent scheduled email {email['_id']}")
-                
-                except Exception as e:
-                    # Mark as failed
-                    await self.db.email_messages.update_one(
-                        {"_id": email["_id"]},
-                        {
-                            "$set": {
-                                "status": "failed",
-                                "error_message": str(e),
-                                "updated_at": now
-                            }
-                        }
-                    )
-                    
-                    results["failed"] += 1
-                    results["errors"].append({
-                        "email_id": str(email["_id"]),
-                        "error": str(e)
-                    })
-                    logger.error(f"❌ Failed to send scheduled email {email['_id']}: {e}")
+            # Status updates and usage increments are applied in bulk afterwards
+            status_updates = []
+            usage_by_company = Counter()
+            rollups = defaultdict(Counter)
+            
+            # Sends are dispatched as the cursor streams documents in and run
+            # concurrently, paced by the provider token buckets
+            async with self._smtp_connection() as smtp:
+                tasks = []
+                async for email in self.db.email_messages.find(query, SCHEDULED_SEND_FIELDS).limit(100):
+                    tasks.append(asyncio.create_task(self._process_one_scheduled(
+                        email, now, smtp, results, status_updates, usage_by_company, rollups
+                    )))
+                await asyncio.gather(*tasks)
+            
+            if status_updates:
+                await self.db.email_messages.bulk_write(status_updates, ordered=False)
+            
+            for company_id, count in usage_by_company.items():
+                # Counted in Redis first, while the cached usage it seeds
+                # from doesn't include these sends yet
+                await self._record_email_quota(company_id, count)
+                await self._increment_email_usage(company_id, count)
+            
+            await self._increment_daily_rollups(rollups)
             
             if results["processed"] > 0 or results["failed"] > 0:
                 logger.info(f"📧 Processed scheduled emails - Sent: {results['processed']}, Failed: {results['failed']}")
@@ -633,6 +1296,93 @@ class EmailService:
             logger.error(f"❌ Error processing scheduled emails: {e}")
             raise
     
+    async def _process_one_scheduled(
+        self,
+        email: Dict[str, Any],
+        now: datetime,
+        smtp: Optional[SMTPPool],
+        results: Dict[str, Any],
+        status_updates: List[UpdateOne],
+        usage_by_company: Counter,
+        rollups: Dict[Tuple[str, datetime], Counter]
+    ) -> None:
+        """Send one due scheduled email and record its outcome"""
+        rollup = rollups[(str(email["company_id"]), _rollup_day(email.get("created_at", now)))]
+        try:
+            # Send the email
+            if self.sendgrid_client:
+                email_id = await self._send_via_sendgrid(
+                    to_email=email["to_email"],
+                    subject=email["subject"],
+                    content=email["content"],
+                    from_email=email["from_email"],
+                    from_name=email["from_name"],
+                    content_type=email["content_type"]
+                )
+                
+                status_updates.append(UpdateOne(
+                    {"_id": email["_id"]},
+                    {
+                        "$set": {
+                            "status": "sent",
+                            "email_id": email_id,
+                            "updated_at": now
+                        }
+                    }
+                ))
+                rollup["status.scheduled"] -= 1
+                rollup["status.sent"] += 1
+            elif settings.SMTP_HOST:
+                await self._send_via_smtp(
+                    to_email=email["to_email"],
+                    subject=email["subject"],
+                    content=email["content"],
+                    from_email=email["from_email"],
+                    from_name=email["from_name"],
+                    content_type=email["content_type"],
+                    smtp=smtp
+                )
+                
+                status_updates.append(UpdateOne(
+                    {"_id": email["_id"]},
+                    {
+                        "$set": {
+                            "status": "sent",
+                            "updated_at": now
+                        }
+                    }
+                ))
+                rollup["status.scheduled"] -= 1
+                rollup["status.sent"] += 1
+            
+            # Update company usage
+            usage_by_company[str(email["company_id"])] += 1
+            
+            results["processed"] += 1
+            logger.info(f"📧 Sent scheduled email {email['_id']}")
+        
+        except Exception as e:
+            # Mark as failed
+            status_updates.append(UpdateOne(
+                {"_id": email["_id"]},
+                {
+                    "$set": {
+                        "status": "failed",
+                        "error_message": str(e),
+                        "updated_at": now
+                    }
+                }
+            ))
+            rollup["status.scheduled"] -= 1
+            rollup["status.failed"] += 1
+            
+            results["failed"] += 1
+            results["errors"].append({
+                "email_id": str(email["_id"]),
+                "error": str(e)
+            })
+            logger.error(f"❌ Failed to send scheduled email {email['_id']}: {e}")
+    
     # Helper methods
     async def _send_via_sendgrid(
         self,
@@ -649,50 +1399,114 @@ class EmailService:
     ) -> str:
         """Send email via SendGrid"""
         try:
-            from_email_obj = Email(from_email, from_name)
-            to_email_obj = To(to_email)
-            
-            if content_type == "html":
-                content_obj = Content("text/html", content)
-            else:
-                content_obj = Content("text/plain", content)
+            personalization: Dict[str, Any] = {"to": [{"email": to_email}]}
+            if cc:
+                personalization["cc"] = [{"email": cc_email} for cc_email in cc]
+            if bcc:
+                personalization["bcc"] = [{"email": bcc_email} for bcc_email in bcc]
             
-            mail = Mail(from_email_obj, to_email_obj, subject, content_obj)
+            payload = self._sendgrid_payload([personalization], subject, content, from_email, from_name, content_type)
             
             # Add reply-to
             if reply_to:
-                mail.reply_to = Email(reply_to)
-            
-            # Add CC/BCC
-            if cc:
-                for cc_email in cc:
-                    mail.add_cc(Email(cc_email))
-            
-            if bcc:
-                for bcc_email in bcc:
-                    mail.add_bcc(Email(bcc_email))
+                payload["reply_to"] = {"email": reply_to}
             
             # Add attachments
             if attachments:
-                for attachment in attachments:
-                    att = Attachment()
-                    att.file_content = FileContent(attachment["content"])
-                    att.file_type = FileType(attachment.get("type", "application/octet-stream"))
-                    att.file_name = FileName(attachment["filename"])
-                    att.disposition = Disposition("attachment")
-                    mail.add_attachment(att)
-            
-            response = self.sendgrid_client.send(mail)
+                payload["attachments"] = [
+                    {
+                        "content": (
+                            attachment["content"] if isinstance(attachment["content"], str)
+                            else base64.b64encode(attachment["content"]).decode("ascii")
+                        ),
+                        "type": attachment.get("type", "application/octet-stream"),
+                        "filename": attachment["filename"],
+                        "disposition": "attachment"
+                    }
+                    for attachment in attachments
+                ]
             
-            if response.status_code in [200, 202]:
-                return response.headers.get("X-Message-Id", "")
-            else:
-                raise Exception(f"SendGrid error: {response.status_code} - {response.body}")
+            return await self._post_to_sendgrid(payload)
             
         except Exception as e:
             logger.error(f"❌ SendGrid send error: {e}")
             raise
     
+    async def _send_via_sendgrid_bulk(
+        self,
+        recipients: List[Dict[str, Any]],
+        subject: str,
+        content: str,
+        from_email: str,
+        from_name: str,
+        content_type: str = "html"
+    ) -> str:
+        """Send one message to many recipients in a single SendGrid request.
+        
+        Each recipient gets their own personalization, so nobody sees the
+        other addresses.
+        """
+        try:
+            personalizations = []
+            for recipient in recipients:
+                to = {"email": recipient["email"]}
+                if recipient.get("name"):
+                    to["name"] = recipient["name"]
+                personalizations.append({"to": [to]})
+            
+            payload = self._sendgrid_payload(personalizations, subject, content, from_email, from_name, content_type)
+            return await self._post_to_sendgrid(payload)
+            
+        except Exception as e:
+            logger.error(f"❌ SendGrid bulk send error: {e}")
+            raise
+    
+    def _sendgrid_payload(
+        self,
+        personalizations: List[Dict[str, Any]],
+        subject: str,
+        content: str,
+        from_email: str,
+        from_name: str,
+        content_type: str
+    ) -> Dict[str, Any]:
+        """Build a v3 mail/send request body"""
+        return {
+            "personalizations": personalizations,
+            "from": {"email": from_email, "name": from_name},
+            "subject": subject,
+            "content": [{
+                "type": "text/html" if content_type == "html" else "text/plain",
+                "value": content
+            }]
+        }
+    
+    async def _post_to_sendgrid(self, payload: Dict[str, Any]) -> str:
+        """POST a mail/send request and return the SendGrid message ID"""
+        await _sendgrid_bucket.acquire()
+        
+        response = await self.sendgrid_client.post("/v3/mail/send", json=payload)
+        
+        if response.status_code in [200, 202]:
+            return response.headers.get("X-Message-Id", "")
+        else:
+            raise Exception(f"SendGrid error: {response.status_code} - {response.text}")
+    
+    @asynccontextmanager
+    async def _smtp_connection(self):
+        """Yield the SMTP session pool to share across a run of sends.
+        
+        Each concurrent send borrows its own session, and connections are
+        opened lazily, so a connect failure fails only the sends that hit
+        it. Yields None when SMTP isn't the active transport, in which case
+        senders fall back to their normal path.
+        """
+        if self.sendgrid_client or not settings.SMTP_HOST:
+            yield None
+            return
+        
+        yield _smtp_pool
+    
     async def _send_via_smtp(
         self,
         to_email: str,
@@ -704,11 +1518,16 @@ class EmailService:
         attachments: Optional[List[Dict[str, Any]]] = None,
         reply_to: Optional[str] = None,
         cc: Optional[List[str]] = None,
-        bcc: Optional[List[str]] = None
+        bcc: Optional[List[str]] = None,
+        smtp: Optional[SMTPPool] = None
     ) -> None:
-        """Send email via SMTP"""
+        """Send email via SMTP, borrowing a session from smtp when one is given"""
+        import aiosmtplib
+        
         try:
-            msg = MIMEMultipart()
+            await _smtp_bucket.acquire()
+            
+            msg = EmailMessage()
             msg["From"] = f"{from_name} <{from_email}>"
             msg["To"] = to_email
             msg["Subject"] = subject
@@ -720,22 +1539,13 @@ class EmailService:
                 msg["Cc"] = ", ".join(cc)
             
             # Add content
-            if content_type == "html":
-                msg.attach(MIMEText(content, "html"))
-            else:
-                msg.attach(MIMEText(content, "plain"))
+            msg.set_content(content, subtype="html" if content_type == "html" else "plain")
             
             # Add attachments
             if attachments:
                 for attachment in attachments:
-                    part = MIMEBase("application", "octet-stream")
-                    part.set_payload(base64.b64decode(attachment["content"]))
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        "Content-Disposition",
-                        f"attachment; filename= {attachment['filename']}"
-                    )
-                    msg.attach(part)
+                    # Decoding and re-encoding multi-MB payloads is CPU bound
+                    await asyncio.to_thread(_add_attachment, msg, attachment)
             
             # Send email
             recipients = [to_email]
@@ -744,15 +1554,28 @@ class EmailService:
             if bcc:
                 recipients.extend(bcc)
             
-            await aiosmtplib.send(
-                msg,
-                hostname=settings.SMTP_HOST,
-                port=settings.SMTP_PORT,
-                username=settings.SMTP_USER,
-                password=settings.SMTP_PASSWORD,
-                use_tls=settings.SMTP_TLS,
-                recipients=recipients
-            )
+            if smtp is None:
+                await aiosmtplib.send(
+                    msg,
+                    hostname=settings.SMTP_HOST,
+                    port=settings.SMTP_PORT,
+                    username=settings.SMTP_USER,
+                    password=settings.SMTP_PASSWORD,
+                    use_tls=settings.SMTP_TLS,
+                    recipients=recipients
+                )
+                return
+            
+            for attempt in range(2):
+                try:
+                    async with smtp.acquire() as session:
+                        await session.send_message(msg, recipients=recipients)
+                    return
+                except aiosmtplib.SMTPServerDisconnected:
+                    # An idle pooled session was dropped by the server; the
+                    # pool discarded it, so retry once on a fresh one
+                    if attempt:
+                        raise
             
         except Exception as e:
             logger.error(f"❌ SMTP send error: {e}")
@@ -760,8 +1583,7 @@ class EmailService:
     
     def _validate_email(self, email: str) -> bool:
         """Validate email address format"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
+        return EMAIL_REGEX.match(email) is not None
     
     async def _process_template_variables(
         self,
@@ -771,105 +1593,346 @@ class EmailService:
         lead_id: Optional[str] = None
     ) -> str:
         """Process template variables in email content"""
+        # Plain content needs no compile, render or context lookups
+        if not TEMPLATE_SYNTAX_REGEX.search(content):
+            return content
+        
         try:
-            template = self.jinja_env.from_string(content)
-            
-            # Build context
-            context = {}
-            
-            # Add company data
-            company = await self.db.companies.find_one({"_id": ObjectId(company_id)})
-            if company:
-                context["company"] = {
-                    "name": company.get("name", ""),
-                    "phone": company.get("phone", ""),
-                    "email": company.get("email", ""),
-                    "website": company.get("website", "")
-                }
-            
-            # Add contact data
-            if contact_id:
-                contact = await self.db.contacts.find_one({"_id": ObjectId(contact_id)})
-                if contact:
-                    context["contact"] = {
-                        "first_name": contact.get("first_name", ""),
-                        "last_name": contact.get("last_name", ""),
-                        "full_name": f"{contact.get('first_name', '')} {contact.get('last_name', '')}".strip(),
-                        "email": contact.get("email", ""),
-                        "phone": contact.get("phone", ""),
-                        "company": contact.get("company", "")
-                    }
+            template = _compile_template(content)
             
-            # Add lead data
-            if lead_id:
-                lead = await self.db.leads.find_one({"_id": ObjectId(lead_id)})
-                if lead:
-                    context["lead"] = {
-                        "status": lead.get("status", ""),
-                        "source": lead.get("source", ""),
-                        "service_type": lead.get("service_type", ""),
-                        "estimated_value": lead.get("estimated_value", 0)
-                    }
+            # Fetch company alongside contact and lead
+            company_context, (contact, lead) = await asyncio.gather(
+                self._get_company_context(company_id),
+                self._fetch_render_context(contact_id, lead_id)
+            )
             
-            return template.render(**context)
+            return template.render(**self._build_template_context(company_context, contact, lead))
             
         except Exception as e:
             logger.error(f"❌ Error processing template variables: {e}")
             return content  # Return original content if processing fails
     
-    async def _check_email_limits(self, company_id: str) -> bool:
-        """Check if company has email sends remaining"""
+    async def _process_template_variables_bulk(
+        self,
+        content: str,
+        company_id: str,
+        contact_ids: List[str]
+    ) -> Dict[str, str]:
+        """Render content for many contacts, keyed by contact_id.
+        
+        Contacts are fetched with one $in query and the template is compiled
+        once, instead of a lookup and compile per recipient. Contacts left
+        out of the result fall back to per-recipient rendering.
+        """
         try:
-            company = await self.db.companies.find_one({"_id": ObjectId(company_id)})
+            template = _compile_template(content)
+        except Exception as e:
+            logger.error(f"❌ Error processing template variables: {e}")
+            return {}
+        
+        object_ids = [ObjectId(cid) for cid in set(contact_ids) if ObjectId.is_valid(cid)]
+        company_context, contacts = await asyncio.gather(
+            self._get_company_context(company_id),
+            self.db.contacts.find({"_id": {"$in": object_ids}}, TEMPLATE_CONTACT_FIELDS).to_list(length=None)
+        )
+        
+        rendered = {}
+        for contact in contacts:
+            try:
+                rendered[str(contact["_id"])] = template.render(
+                    **self._build_template_context(company_context, contact, None)
+                )
+            except Exception as e:
+                logger.error(f"❌ Error processing template variables: {e}")
+        return rendered
+    
+    def _build_template_context(
+        self,
+        company_context: Optional[Dict[str, Any]],
+        contact: Optional[Dict[str, Any]],
+        lead: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Build the Jinja context exposed to email templates"""
+        context = {}
+        
+        # Add company data
+        if company_context:
+            context["company"] = company_context
+        
+        # Add contact data
+        if contact:
+            context["contact"] = {
+                "first_name": contact.get("first_name", ""),
+                "last_name": contact.get("last_name", ""),
+                "full_name": f"{contact.get('first_name', '')} {contact.get('last_name', '')}".strip(),
+                "email": contact.get("email", ""),
+                "phone": contact.get("phone", ""),
+                "company": contact.get("company", "")
+            }
+        
+        # Add lead data
+        if lead:
+            context["lead"] = {
+                "status": lead.get("status", ""),
+                "source": lead.get("source", ""),
+                "service_type": lead.get("service_type", ""),
+                "estimated_value": lead.get("estimated_value", 0)
+            }
+        
+        return context
+    
+    async def _fetch_render_context(
+        self,
+        contact_id: Optional[str],
+        lead_id: Optional[str]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Load the contact and lead fields used by templates.
+        
+        When both are given, the lead is joined onto the contact with
+        $lookup so the pair comes back in a single round-trip.
+        """
+        if contact_id and lead_id:
+            docs = await self.db.contacts.aggregate([
+                {"$match": {"_id": ObjectId(contact_id)}},
+                {"$project": TEMPLATE_CONTACT_FIELDS},
+                {
+                    "$lookup": {
+                        "from": "leads",
+                        "pipeline": [
+                            {"$match": {"_id": ObjectId(lead_id)}},
+                            {"$project": TEMPLATE_LEAD_FIELDS}
+                        ],
+                        "as": "lead"
+                    }
+                }
+            ]).to_list(length=1)
+            
+            if docs:
+                contact = docs[0]
+                leads = contact.pop("lead")
+                return contact, leads[0] if leads else None
+            
+            # Missing contact - the lead may still exist on its own
+            return None, await self.db.leads.find_one({"_id": ObjectId(lead_id)}, TEMPLATE_LEAD_FIELDS)
+        
+        contact, lead = await asyncio.gather(
+            self.db.contacts.find_one({"_id": ObjectId(contact_id)}, TEMPLATE_CONTACT_FIELDS) if contact_id else _none(),
+            self.db.leads.find_one({"_id": ObjectId(lead_id)}, TEMPLATE_LEAD_FIELDS) if lead_id else _none()
+        )
+        return contact, lead
+    
+    async def _get_company_context(self, company_id: str) -> Optional[Dict[str, Any]]:
+        """Get the company template context, cached briefly across sends"""
+        async def _load() -> Optional[Dict[str, Any]]:
+            company = await self.db.companies.find_one(
+                {"_id": ObjectId(company_id)},
+                {"name": 1, "phone": 1, "email": 1, "website": 1}
+            )
             if not company:
-                return False
+                return None
+            return {
+                "name": company.get("name", ""),
+                "phone": company.get("phone", ""),
+                "email": company.get("email", ""),
+                "website": company.get("website", "")
+            }
+        
+        return await _company_context_cache.get_or_load(company_id, _load)
+    
+    async def _check_email_limits(self, company_id: str, count: int = 1) -> Tuple[bool, int]:
+        """Reserve count sends against the company's monthly email limit.
+        
+        Returns (allowed, reserved). reserved is how many sends were added
+        to the Redis counter; callers hand them back with
+        _release_email_quota if the emails don't go out.
+        """
+        try:
+            billing_info = await _billing_info_cache.get_or_load(
+                company_id, lambda: self._load_billing_info(company_id)
+            )
+            if billing_info is None:
+                return False, 0
             
-            billing_info = company.get("billing_info", {})
             monthly_limit = billing_info.get("monthly_email_limit", 0)
             monthly_used = billing_info.get("monthly_email_used", 0)
             
-            return monthly_used < monthly_limit
+            total = await self._reserve_email_quota(company_id, count, monthly_used)
+            if total is not None:
+                if total <= monthly_limit:
+                    return True, count
+                # Over the limit - give the reservation back
+                await self._release_email_quota(company_id, count)
+                return False, 0
+            
+            # Redis unavailable - check the recorded usage directly
+            billing_info = await self._load_billing_info(company_id)
+            if billing_info is None:
+                return False, 0
+            return billing_info.get("monthly_email_used", 0) + count <= monthly_limit, 0
             
         except Exception as e:
             logger.error(f"❌ Error checking email limits: {e}")
-            return False
+            return False, 0
+    
+    async def _load_billing_info(self, company_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a company's billing_info, or None if the company is missing"""
+        company = await self.db.companies.find_one(
+            {"_id": ObjectId(company_id)},
+            BILLING_INFO_FIELDS
+        )
+        if not company:
+            return None
+        return company.get("billing_info", {})
+    
+    async def _reserve_email_quota(self, company_id: str, count: int, monthly_used: int) -> Optional[int]:
+        """Atomically add count to this month's Redis send counter.
+        
+        Returns the new total, or None when Redis cannot be reached. A new
+        month's counter is seeded from the usage recorded in MongoDB; the
+        seed and the increment run in one MULTI so concurrent first sends
+        all see the seeded count.
+        """
+        global _redis_retry_at
+        if time.monotonic() < _redis_retry_at:
+            return None
+        
+        from redis.exceptions import RedisError
+        
+        key = _email_quota_key(company_id)
+        try:
+            async with _get_redis().pipeline(transaction=True) as pipe:
+                pipe.set(key, monthly_used, nx=True, ex=EMAIL_QUOTA_KEY_TTL)
+                pipe.incrby(key, count)
+                _, total = await pipe.execute()
+            return total
+        except RedisError as e:
+            logger.warning(f"⚠️ Redis email quota unavailable, using MongoDB: {e}")
+            _redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+            return None
     
-    async def _increment_email_usage(self, company_id: str) -> None:
-        """Increment email usage counter"""
+    async def _release_email_quota(self, company_id: str, count: int) -> None:
+        """Give back sends reserved in Redis that were not delivered"""
+        if count <= 0:
+            return
+        
+        from redis.exceptions import RedisError
+        
         try:
-            await self.db.companies.update_one(
-                {"_id": ObjectId(company_id)},
-                {
-                    "$inc": {"billing_info.monthly_email_used": 1},
-                    "$set": {"updated_at": datetime.utcnow()}
-                }
+            await _get_redis().decrby(_email_quota_key(company_id), count)
+        except RedisError as e:
+            logger.warning(f"⚠️ Could not release {count} reserved emails for {company_id}: {e}")
+    
+    async def _record_email_quota(self, company_id: str, count: int) -> None:
+        """Add sends that went out without a reservation to the Redis counter"""
+        try:
+            billing_info = await _billing_info_cache.get_or_load(
+                company_id, lambda: self._load_billing_info(company_id)
             )
+            if billing_info is not None:
+                await self._reserve_email_quota(company_id, count, billing_info.get("monthly_email_used", 0))
+        except Exception as e:
+            logger.error(f"❌ Error recording email usage for {company_id}: {e}")
+    
+    async def _increment_email_usage(self, company_id: str, count: int = 1) -> None:
+        """Increment email usage counter.
+        
+        The write is coalesced with other sends and flushed shortly after.
+        """
+        company_id = str(company_id)
+        _write_buffer.add(
+            self.db,
+            "companies",
+            ObjectId(company_id),
+            set_fields={"updated_at": datetime.utcnow()},
+            inc_fields={"billing_info.monthly_email_used": count}
+        )
+        
+        # Keep the cached limit check in step with the new count
+        billing_info = _billing_info_cache.get(company_id)
+        if billing_info is not None:
+            billing_info["monthly_email_used"] = billing_info.get("monthly_email_used", 0) + count
+    
+    async def _increment_daily_rollup(
+        self,
+        company_id: Union[str, ObjectId],
+        when: datetime,
+        increments: Dict[str, int]
+    ) -> None:
+        """Apply counter increments to one company's daily analytics rollup"""
+        await self._increment_daily_rollups({(str(company_id), _rollup_day(when)): increments})
+    
+    async def _increment_daily_rollups(self, rollups: Dict[Tuple[str, datetime], Dict[str, int]]) -> None:
+        """Upsert email_analytics_daily counters, keyed by (company_id, day)"""
+        try:
+            operations = [
+                UpdateOne(
+                    {"company_id": ObjectId(company_id), "day": day},
+                    {"$inc": {field: n for field, n in increments.items() if n}},
+                    upsert=True
+                )
+                for (company_id, day), increments in rollups.items()
+                if any(increments.values())
+            ]
+            if operations:
+                await self.db.email_analytics_daily.bulk_write(operations, ordered=False)
         except Exception as e:
-            logger.error(f"❌ Error incrementing email usage: {e}")
+            logger.error(f"❌ Error updating email analytics rollups: {e}")
+    
+    def _apply_contact_events(self, contact_id: str, events: List[Dict[str, Dict[str, Any]]]) -> None:
+        """Fold contact events into one buffered update.
+        
+        Each event is {"$set": {...}, "$inc": {...}}; every event for a
+        contact within the flush window is written as a single UpdateOne.
+        """
+        doc_id = ObjectId(contact_id)
+        for event in events:
+            _write_buffer.add(
+                self.db,
+                "contacts",
+                doc_id,
+                set_fields=event.get("$set"),
+                inc_fields=event.get("$inc")
+            )
     
     async def _update_contact_last_contact(self, contact_id: str, contact_type: str) -> None:
         """Update contact last contact timestamp"""
         try:
-            await self.db.contacts.update_one(
-                {"_id": ObjectId(contact_id)},
+            now = datetime.utcnow()
+            self._apply_contact_events(contact_id, [{
+                "$set": {
+                    "last_contact": now,
+                    "last_contact_type": contact_type,
+                    "updated_at": now
+                }
+            }])
+        except Exception as e:
+            logger.error(f"❌ Error updating contact last contact: {e}")
+    
+    async def _update_contacts_last_contact(self, contact_ids: List[str], contact_type: str) -> None:
+        """Update last contact timestamp for many contacts at once"""
+        try:
+            now = datetime.utcnow()
+            await self.db.contacts.update_many(
+                {"_id": {"$in": [ObjectId(cid) for cid in contact_ids]}},
                 {
                     "$set": {
-                        "last_contact": datetime.utcnow(),
+                        "last_contact": now,
                         "last_contact_type": contact_type,
-                        "updated_at": datetime.utcnow()
+                        "updated_at": now
                     }
                 }
             )
         except Exception as e:
-            logger.error(f"❌ Error updating contact last contact: {e}")
+            logger.error(f"❌ Error updating contacts last contact: {e}")
     
     async def _update_lead_communication(self, lead_id: str, communication_type: str) -> None:
         """Update lead communication tracking"""
         try:
-            update_data = {"updated_at": datetime.utcnow()}
+            now = datetime.utcnow()
+            update_data = {"updated_at": now}
             
             if communication_type == "email":
-                update_data["last_email_sent"] = datetime.utcnow()
+                update_data["last_email_sent"] = now
             
             await self.db.leads.update_one(
                 {"_id": ObjectId(lead_id)},
@@ -884,16 +1947,14 @@ class EmailService:
             # Simple engagement scoring
             score_increment = 0.1 if engagement_type == "email_opened" else 0.2
             
-            await self.db.contacts.update_one(
-                {"_id": ObjectId(contact_id)},
-                {
-                    "$inc": {"email_engagement_score": score_increment},
-                    "$set": {
-                        f"last_{engagement_type}": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
-                    }
+            now = datetime.utcnow()
+            self._apply_contact_events(contact_id, [{
+                "$inc": {"email_engagement_score": score_increment},
+                "$set": {
+                    f"last_{engagement_type}": now,
+                    "updated_at": now
                 }
-            )
+            }])
         except Exception as e:
             logger.error(f"❌ Error updating contact engagement: {e}")
     
@@ -916,86 +1977,63 @@ class EmailService:
             if bounce_type == "hard":
                 update_data["email_opt_in"] = False
             
-            await self.db.contacts.update_one(
-                {"_id": ObjectId(contact_id)},
-                {"$set": update_data}
-            )
+            self._apply_contact_events(contact_id, [{"$set": update_data}])
         except Exception as e:
             logger.error(f"❌ Error handling contact bounce: {e}")
-async def send_booking_confirmation(
-    self,
-    customer_email: str,
-    customer_name: str,
-    service_type: str,
-    location: str = "To be confirmed",
-    scheduled_time: str = "To be confirmed",
-    booking_id: str = "",
-    admin_notes: str = ""
-) -> bool:
-    """Send booking confirmation email to customer"""
-    try:
-        import smtplib
-        from email.mime.text import MIMEText
-        from email.mime.multipart import MIMEMultipart
-
-        logger.info(f"📧 Preparing confirmation email for {customer_email}")
-
-        subject = f"✅ Booking Confirmed - {service_type}"
+    
+    async def send_booking_confirmation(
+        self,
+        customer_email: str,
+        customer_name: str,
+        service_type: str,
+        location: str = "To be confirmed",
+        scheduled_time: str = "To be confirmed",
+        booking_id: str = "",
+        admin_notes: str = ""
+    ) -> bool:
+        """Send booking confirmation email to customer"""
+        try:
+            import aiosmtplib
 
-        # Simple HTML email
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; padding: 20px;">
-            <h2 style="color: #4F46E5;">🎉 Booking Confirmed!</h2>
+            logger.info(f"📧 Preparing confirmation email for {customer_email}")
 
-            <p>Dear {customer_name},</p>
+            html_body = BOOKING_CONFIRMATION_TEMPLATE.render(
+                customer_name=customer_name,
+                service_type=service_type,
+                location=location,
+                scheduled_time=scheduled_time,
+                booking_id=booking_id,
+                admin_notes=admin_notes
+            )
 
-            <p>Great news! Your booking has been confirmed by our team.</p>
+            # Create message
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = f"✅ Booking Confirmed - {service_type}"
+            msg['From'] = BOOKING_FROM_HEADER
+            msg['To'] = customer_email
 
-            <div style="background: #f0f9ff; padding: 20px; border-left: 4px solid #4F46E5; margin: 20px 0;">
-                <h3 style="margin-top: 0;">Booking Details</h3>
-                <p><strong>Service:</strong> {service_type}</p>
-                <p><strong>Location:</strong> {location}</p>
-                <p><strong>Time:</strong> {scheduled_time}</p>
-                <p><strong>Booking ID:</strong> {booking_id}</p>
-                {f'<div style="margin-top: 15px; padding: 10px; background: #FEF3C7; border-radius: 4px;"><strong>Admin Note:</strong> {admin_notes}</div>' if admin_notes else ''}
-            </div>
+            # Attach HTML
+            msg.attach(MIMEText(html_body, 'html'))
 
-            <p>Our team will contact you within 24 hours to finalize details.</p>
+            # Reuse a logged-in session from the pool; a session the server
+            # dropped while idle is discarded and the send retried once
+            for attempt in range(2):
+                try:
+                    async with _booking_smtp_pool.acquire() as smtp:
+                        await smtp.send_message(msg)
+                    break
+                except aiosmtplib.SMTPServerDisconnected:
+                    if attempt:
+                        raise
 
-            <p>Best regards,<br><strong>Your Service Team</strong></p>
-        </body>
-        </html>
-        """
+            logger.info(f"✅ Confirmation email sent to {customer_email}")
+            return True
 
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = f"Service Team <{settings.EMAIL_USER}>"
-        msg['To'] = customer_email
-
-        # Attach HTML
-        msg.attach(MIMEText(html_body, 'html'))
-
-        # Use a thread to run the blocking SMTP operations to avoid blocking the event loop
-        def _send():
-            logger.info(f"📧 Connecting to SMTP: {settings.EMAIL_HOST}:{settings.EMAIL_PORT}")
-            with smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT) as server:
-                server.starttls()
-                logger.info(f"📧 Logging in as: {settings.EMAIL_USER}")
-                server.login(settings.EMAIL_USER, settings.EMAIL_PASSWORD)
-                server.send_message(msg)
-
-        await asyncio.to_thread(_send)
-
-        logger.info(f"✅ Confirmation email sent to {customer_email}")
-        return True
-
-    except Exception as e:
-        logger.error(f"❌ Failed to send confirmation email: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return False
+        except Exception as e:
+            logger.error(f"❌ Failed to send confirmation email: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return False
 
 
 # Export the service
@@ -1,60 +1,206 @@
 # backend/app/services/enhanced_ai_service.py
+import asyncio
+import httpx
 import openai
 import json
 import logging
-from typing import Dict, List, Any, Optional
+import re
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 
 from app.core.config import settings
+from app.utils.log_queue import LogQueue
+from app.utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+# ai_services fields used for matching and responses
+SERVICE_FIELDS = {
+    "name": 1,
+    "category": 1,
+    "description": 1,
+    "keywords": 1,
+    "pricing": 1,
+    "availability": 1,
+    "prompts": 1
+}
+
+# Active services per company and their keyword matcher; every chat
+# message reads them
+_services_cache = TTLCache(maxsize=2048, ttl=60)
+
+def invalidate_company_services(company_id: str) -> None:
+    """Drop a company's cached services after they are changed"""
+    _services_cache.pop(str(company_id))
+
+# OpenAI results for repeated questions ("how much does it cost?"). Keys
+# include the service context sent in the prompt, so edited services
+# never reuse an answer generated for their old configuration.
+AI_CACHE_TTL = 3600
+_ai_match_cache = TTLCache(maxsize=4096, ttl=AI_CACHE_TTL)
+_ai_response_cache = TTLCache(maxsize=4096, ttl=AI_CACHE_TTL)
+
+NON_WORD_REGEX = re.compile(r"[^\w]+")
+
+# One async client for every service instance; completions in flight are
+# capped so a burst of chats cannot exhaust sockets or the rate limit
+OPENAI_MAX_CONCURRENCY = 50
+_openai_client: Optional[openai.AsyncOpenAI] = None
+_openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+def _get_openai_client() -> Optional[openai.AsyncOpenAI]:
+    """Shared AsyncOpenAI client, or None when no API key is configured"""
+    global _openai_client
+    if _openai_client is None and settings.OPENAI_API_KEY:
+        # Pool sized to the concurrency cap so every completion in flight
+        # can keep its own warm connection
+        _openai_client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=httpx.AsyncClient(
+                timeout=60,
+                limits=httpx.Limits(
+                    max_keepalive_connections=OPENAI_MAX_CONCURRENCY,
+                    max_connections=OPENAI_MAX_CONCURRENCY * 2
+                )
+            )
+        )
+    return _openai_client
+
+def _normalize_message(message: str) -> str:
+    """Lowercase a message and drop punctuation and extra whitespace"""
+    return NON_WORD_REGEX.sub(" ", message.lower()).strip()
+
+LOG_FLUSH_INTERVAL = 0.1
+_interaction_log = LogQueue("ai_interactions", LOG_FLUSH_INTERVAL, batch_size=500, maxsize=10000)
+
+async def close_ai_clients() -> None:
+    """Write queued interaction logs and close the OpenAI client on shutdown"""
+    global _openai_client
+    await _interaction_log.close()
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+
+# Intent keywords in priority order, matched anywhere in the message so
+# "booking" or "costs" still count
+INTENT_PATTERNS = [
+    (intent, re.compile("|".join(re.escape(word) for word in words)))
+    for intent, words in (
+        ("pricing_inquiry", ("price", "cost", "rate", "charge", "fee", "how much", "pkr")),
+        ("booking_request", ("book", "schedule", "appointment", "when can", "available", "confirm")),
+        ("complex_request", ("emergency", "urgent", "problem", "issue", "broken", "not working"))
+    )
+]
+
 class EnhancedAIService:
     """Enhanced AI Service with Dynamic Service Management Integration"""
     
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
-        self.openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
+        self.openai_client = _get_openai_client()
         
     async def get_company_services(self, company_id: str) -> List[Dict[str, Any]]:
-        """Fetch active services for a company"""
+        """Fetch active services for a company, cached for up to a minute"""
+        catalog = await self._get_service_catalog(company_id)
+        return catalog["services"] if catalog else []
+    
+    async def _get_service_catalog(self, company_id: str) -> Optional[Dict[str, Any]]:
+        """Cached services plus the keyword matcher built from them"""
         try:
-            services = await self.db.ai_services.find({
-                "company_id": ObjectId(company_id),
-                "active": True
-            }).to_list(length=100)
-            
-            return [{
-                "id": str(service["_id"]),
-                "name": service["name"],
-                "category": service["category"],
-                "description": service["description"],
-                "keywords": service["keywords"],
-                "pricing": service["pricing"],
-                "availability": service["availability"],
-                "prompts": service["prompts"]
-            } for service in services]
-            
+            return await _services_cache.get_or_load(
+                str(company_id), lambda: self._load_service_catalog(company_id)
+            )
         except Exception as e:
             logger.error(f"Error fetching company services: {e}")
-            return []
+            return None
+    
+    async def _load_service_catalog(self, company_id: str) -> Dict[str, Any]:
+        """Load active services for a company and build their keyword matcher"""
+        services = await self.db.ai_services.find(
+            {
+                "company_id": ObjectId(company_id),
+                "active": True
+            },
+            SERVICE_FIELDS
+        ).to_list(length=100)
+        
+        services = [{
+            "id": str(service["_id"]),
+            "name": service["name"],
+            "category": service["category"],
+            "description": service["description"],
+            "keywords": service["keywords"],
+            # Lowercased once per load instead of on every message
+            "keyword_set": frozenset(keyword.lower() for keyword in service["keywords"]),
+            "pricing": service["pricing"],
+            "availability": service["availability"],
+            "prompts": service["prompts"]
+        } for service in services]
+        
+        # Each keyword maps to the first service listing it
+        first_owner: Dict[str, int] = {}
+        for index, service in enumerate(services):
+            for keyword in service["keyword_set"]:
+                if keyword:
+                    first_owner.setdefault(keyword, index)
+        
+        # The scan below reports only the longest keyword at each position,
+        # so fold in every shorter keyword that is a prefix of it. The lowest
+        # owner found then matches what the ordered per-service scan returns.
+        keyword_owner = {
+            keyword: min(
+                first_owner[keyword[:end]]
+                for end in range(1, len(keyword) + 1)
+                if keyword[:end] in first_owner
+            )
+            for keyword in first_owner
+        }
+        
+        # One lookahead alternation finds keywords at every position of the
+        # message in a single pass, including overlapping ones
+        keyword_pattern = None
+        if keyword_owner:
+            keyword_pattern = re.compile("(?=(" + "|".join(
+                re.escape(keyword) for keyword in sorted(keyword_owner, key=len, reverse=True)
+            ) + "))")
+        
+        # Service list for the OpenAI matching prompt, formatted once per load
+        prompt_block = "\n".join(
+            f"{i}: {service['name']} - {service['description']} "
+            f"(Keywords: {', '.join(service['keywords'])})"
+            for i, service in enumerate(services)
+        )
+        
+        return {
+            "services": services,
+            "keyword_pattern": keyword_pattern,
+            "keyword_owner": keyword_owner,
+            "prompt_block": prompt_block
+        }
     
     async def match_service_from_message(self, company_id: str, message: str) -> Optional[Dict[str, Any]]:
         """Match user message to available services based on keywords"""
         try:
-            services = await self.get_company_services(company_id)
-            message_lower = message.lower()
+            catalog = await self._get_service_catalog(company_id)
+            services = catalog["services"] if catalog else []
             
             # Try exact keyword matching first
-            for service in services:
-                if any(keyword.lower() in message_lower for keyword in service["keywords"]):
-                    return service
+            if catalog and catalog["keyword_pattern"]:
+                owners = catalog["keyword_owner"]
+                matched = [
+                    owners[match.group(1)]
+                    for match in catalog["keyword_pattern"].finditer(message.lower())
+                ]
+                if matched:
+                    return services[min(matched)]
             
             # If no exact match, try fuzzy matching with OpenAI
             if self.openai_client and services:
-                return await self._ai_service_matching(services, message)
+                return await self._ai_service_matching(catalog, message)
                 
             return None
             
@@ -62,19 +208,20 @@ class EnhancedAIService:
             logger.error(f"Error matching service: {e}")
             return None
     
-    async def _ai_service_matching(self, services: List[Dict], message: str) -> Optional[Dict[str, Any]]:
+    async def _ai_service_matching(self, catalog: Dict[str, Any], message: str) -> Optional[Dict[str, Any]]:
         """Use OpenAI to intelligently match services when keyword matching fails"""
         try:
-            service_descriptions = []
-            for i, service in enumerate(services):
-                service_descriptions.append(
-                    f"{i}: {service['name']} - {service['description']} "
-                    f"(Keywords: {', '.join(service['keywords'])})"
-                )
+            services = catalog["services"]
+            prompt_block = catalog["prompt_block"]
+            
+            cache_key = (prompt_block, _normalize_message(message))
+            cached = _ai_match_cache.get(cache_key, _MISSING)
+            if cached is not _MISSING:
+                return services[cached] if cached is not None else None
             
             prompt = f"""
 Given these available services:
-{chr(10).join(service_descriptions)}
+{prompt_block}
 
 User message: "{message}"
 
@@ -82,7 +229,7 @@ Return ONLY the number (0, 1, 2, etc.) of the best matching service, or "none" i
 Consider synonyms, related terms, and context. Be strict - only match if reasonably certain.
 """
 
-            response = await self.openai_client.chat.completions.create(
+            response = await self._chat_completion(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=10,
@@ -91,15 +238,20 @@ Consider synonyms, related terms, and context. Be strict - only match if reasona
             
             result = response.choices[0].message.content.strip()
             
-            if result.isdigit() and 0 <= int(result) < len(services):
-                return services[int(result)]
-                
-            return None
+            index = int(result) if result.isdigit() and 0 <= int(result) < len(services) else None
+            _ai_match_cache.set(cache_key, index)
+            
+            return services[index] if index is not None else None
             
         except Exception as e:
             logger.error(f"Error in AI service matching: {e}")
             return None
     
+    async def _chat_completion(self, **kwargs):
+        """Create a chat completion, waiting for a free slot when many are in flight"""
+        async with _openai_semaphore:
+            return await self.openai_client.chat.completions.create(**kwargs)
+    
     async def generate_dynamic_response(
         self, 
         company_id: str, 
@@ -141,6 +293,52 @@ Consider synonyms, related terms, and context. Be strict - only match if reasona
                 "requires_human": True
             }
     
+    def _service_base_response(self, service: Dict[str, Any], message: str) -> Tuple[str, str]:
+        """Intent of a message and the service's prompt template for it"""
+        # Determine intent from message
+        intent = self._analyze_intent(message)
+        
+        # Base response using service prompts
+        if intent == "pricing_inquiry":
+            base_response = service["prompts"]["responses"]["pricing"]
+        elif intent == "booking_request":
+            base_response = service["prompts"]["responses"]["booking"]
+        else:
+            base_response = service["prompts"]["greeting"]
+        
+        return intent, base_response
+    
+    def _service_response(
+        self,
+        service: Dict[str, Any],
+        message: str,
+        intent: str,
+        reply: str,
+        conversation_history: List[Dict] = None,
+        customer_info: Dict = None
+    ) -> Dict[str, Any]:
+        """Build the response dict for a matched service's reply"""
+        # Check if booking completion criteria are met
+        booking_ready = self._check_booking_completion(
+            message, conversation_history, customer_info
+        )
+        
+        if booking_ready:
+            reply += f"\n\nBOOKING_CONFIRMED: {service['name']} service for customer. Contact: {customer_info.get('email', 'N/A')}"
+        
+        return {
+            "message": reply,
+            "intent": intent,
+            "matched_service": {
+                "id": service["id"],
+                "name": service["name"],
+                "category": service["category"],
+                "pricing": service["pricing"]
+            },
+            "requires_human": intent == "complex_request",
+            "booking_ready": booking_ready
+        }
+    
     async def _generate_service_response(
         self, 
         service: Dict[str, Any], 
@@ -150,16 +348,7 @@ Consider synonyms, related terms, and context. Be strict - only match if reasona
     ) -> Dict[str, Any]:
         """Generate response using matched service configuration"""
         try:
-            # Determine intent from message
-            intent = self._analyze_intent(message)
-            
-            # Base response using service prompts
-            if intent == "pricing_inquiry":
-                base_response = service["prompts"]["responses"]["pricing"]
-            elif intent == "booking_request":
-                base_response = service["prompts"]["responses"]["booking"]
-            else:
-                base_response = service["prompts"]["greeting"]
+            intent, base_response = self._service_base_response(service, message)
             
             # Enhance with OpenAI if available
             if self.openai_client:
@@ -169,27 +358,10 @@ Consider synonyms, related terms, and context. Be strict - only match if reasona
             else:
                 enhanced_response = base_response
             
-            # Check if booking completion criteria are met
-            booking_ready = self._check_booking_completion(
-                message, conversation_history, customer_info
+            return self._service_response(
+                service, message, intent, enhanced_response, conversation_history, customer_info
             )
             
-            if booking_ready:
-                enhanced_response += f"\n\nBOOKING_CONFIRMED: {service['name']} service for customer. Contact: {customer_info.get('email', 'N/A')}"
-            
-            return {
-                "message": enhanced_response,
-                "intent": intent,
-                "matched_service": {
-                    "id": service["id"],
-                    "name": service["name"],
-                    "category": service["category"],
-                    "pricing": service["pricing"]
-                },
-                "requires_human": intent == "complex_request",
-                "booking_ready": booking_ready
-            }
-            
         except Exception as e:
             logger.error(f"Error generating service response: {e}")
             return {
@@ -199,36 +371,49 @@ Consider synonyms, related terms, and context. Be strict - only match if reasona
                 "requires_human": False
             }
     
-    async def _enhance_response_with_ai(
+    def _enhance_request(self, prompt: str) -> Dict[str, Any]:
+        """Chat completion arguments for an enhancement prompt"""
+        return {
+            "model": settings.OPENAI_MODEL or "gpt-3.5-turbo",
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 200,
+            "temperature": 0.7
+        }
+    
+    def _build_enhance_prompt(
         self,
         service: Dict[str, Any],
         message: str,
         base_response: str,
         conversation_history: List[Dict] = None,
         customer_info: Dict = None
-    ) -> str:
-        """Use OpenAI to enhance the base response with context"""
-        try:
-            # Build context
-            context_parts = [
-                f"Service: {service['name']} - {service['description']}",
-                f"Pricing: PKR {service['pricing']['min']} - PKR {service['pricing']['max']}",
-                f"Availability: {service['availability']['hours']}, {service['availability']['days']}",
-                f"Base response template: {base_response}"
-            ]
-            
-            if customer_info:
-                context_parts.append(f"Customer info: {json.dumps(customer_info)}")
-            
-            if conversation_history:
-                recent_history = conversation_history[-3:]  # Last 3 messages
-                history_text = "\n".join([
-                    f"{msg.get('role', 'user')}: {msg.get('content', msg.get('message', ''))}"
-                    for msg in recent_history
-                ])
-                context_parts.append(f"Recent conversation:\n{history_text}")
-            
-            prompt = f"""
+    ) -> Tuple[str, Optional[Tuple[str, str]]]:
+        """Build the enhancement prompt and, when the reply can be reused, its cache key"""
+        # Build context
+        context_parts = [
+            f"Service: {service['name']} - {service['description']}",
+            f"Pricing: PKR {service['pricing']['min']} - PKR {service['pricing']['max']}",
+            f"Availability: {service['availability']['hours']}, {service['availability']['days']}",
+            f"Base response template: {base_response}"
+        ]
+        
+        if customer_info:
+            context_parts.append(f"Customer info: {json.dumps(customer_info)}")
+        
+        if conversation_history:
+            recent_history = conversation_history[-3:]  # Last 3 messages
+            history_text = "\n".join([
+                f"{msg.get('role', 'user')}: {msg.get('content', msg.get('message', ''))}"
+                for msg in recent_history
+            ])
+            context_parts.append(f"Recent conversation:\n{history_text}")
+        
+        # Replies that depend on a customer or conversation are not reused
+        cache_key = None
+        if not customer_info and not conversation_history:
+            cache_key = ("\n".join(context_parts), _normalize_message(message))
+        
+        prompt = f"""
 You are a professional customer service AI for a home services company in Lahore, Pakistan.
 
 Context:
@@ -246,20 +431,95 @@ Instructions:
 
 Generate a natural, helpful response:
 """
-
-            response = await self.openai_client.chat.completions.create(
-                model=settings.OPENAI_MODEL or "gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200,
-                temperature=0.7
+        return prompt, cache_key
+    
+    async def _enhance_response_with_ai(
+        self,
+        service: Dict[str, Any],
+        message: str,
+        base_response: str,
+        conversation_history: List[Dict] = None,
+        customer_info: Dict = None
+    ) -> str:
+        """Use OpenAI to enhance the base response with context"""
+        try:
+            prompt, cache_key = self._build_enhance_prompt(
+                service, message, base_response, conversation_history, customer_info
             )
+            if cache_key is not None:
+                cached = _ai_response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
+            response = await self._chat_completion(**self._enhance_request(prompt))
             
-            return response.choices[0].message.content.strip()
+            enhanced = response.choices[0].message.content.strip()
+            if cache_key is not None:
+                _ai_response_cache.set(cache_key, enhanced)
+            
+            return enhanced
             
         except Exception as e:
             logger.error(f"Error enhancing response: {e}")
             return base_response
     
+    async def stream_enhanced_response(
+        self,
+        service: Dict[str, Any],
+        message: str,
+        base_response: str,
+        conversation_history: List[Dict] = None,
+        customer_info: Dict = None
+    ) -> AsyncIterator[str]:
+        """Like _enhance_response_with_ai, but yield the reply as OpenAI generates it.
+        
+        Not called by any endpoint yet: the chat WebSocket answers through
+        AIChatbotService.process_message. A handler that wants to forward
+        text as it arrives can iterate this instead of awaiting the whole
+        completion. Falls back to base_response when nothing could be
+        generated.
+        """
+        if not self.openai_client:
+            yield base_response
+            return
+        
+        sent_any = False
+        try:
+            prompt, cache_key = self._build_enhance_prompt(
+                service, message, base_response, conversation_history, customer_info
+            )
+            if cache_key is not None:
+                cached = _ai_response_cache.get(cache_key)
+                if cached is not None:
+                    yield cached
+                    return
+            
+            parts = []
+            # The concurrency slot is held while the request is opened; the
+            # tokens then arrive on the already established stream
+            stream = await self._chat_completion(**self._enhance_request(prompt), stream=True)
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if not text:
+                    continue
+                # Match the stripped reply from the non-streaming path
+                if not sent_any:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                parts.append(text)
+                sent_any = True
+                yield text
+            
+            if cache_key is not None and parts:
+                _ai_response_cache.set(cache_key, "".join(parts).strip())
+            
+        except Exception as e:
+            logger.error(f"Error streaming enhanced response: {e}")
+        
+        if not sent_any:
+            yield base_response
+    
     async def _generate_fallback_response(
         self, 
         services: List[Dict[str, Any]], 
@@ -293,17 +553,9 @@ Generate a natural, helpful response:
         """Analyze message intent"""
         message_lower = message.lower()
         
-        # Pricing keywords
-        if any(word in message_lower for word in ["price", "cost", "rate", "charge", "fee", "how much", "pkr"]):
-            return "pricing_inquiry"
-        
-        # Booking keywords
-        if any(word in message_lower for word in ["book", "schedule", "appointment", "when can", "available", "confirm"]):
-            return "booking_request"
-        
-        # Complex requests
-        if any(word in message_lower for word in ["emergency", "urgent", "problem", "issue", "broken", "not working"]):
-            return "complex_request"
+        for intent, pattern in INTENT_PATTERNS:
+            if pattern.search(message_lower):
+                return intent
         
         # General inquiry
         return "general_inquiry"
@@ -332,8 +584,9 @@ Generate a natural, helpful response:
         intent: str,
         customer_info: Dict = None
     ):
-        """Log AI interactions for analytics"""
+        """Queue an AI interaction for analytics; it is written in the background"""
         try:
+            now = datetime.utcnow()
             log_doc = {
                 "company_id": ObjectId(company_id),
                 "service_id": ObjectId(service_id) if service_id else None,
@@ -341,11 +594,11 @@ Generate a natural, helpful response:
                 "ai_response": response,
                 "intent": intent,
                 "customer_info": customer_info or {},
-                "timestamp": datetime.utcnow(),
-                "session_date": datetime.utcnow().date().isoformat()
+                "timestamp": now,
+                "session_date": now.date().isoformat()
             }
             
-            await self.db.ai_interactions.insert_one(log_doc)
+            _interaction_log.put(self.db, log_doc)
             
         except Exception as e:
             logger.error(f"Error logging interaction: {e}")
@@ -357,36 +610,35 @@ Generate a natural, helpful response:
             
             start_date = datetime.utcnow() - timedelta(days=days)
             
-            # Total interactions
-            total_interactions = await self.db.ai_interactions.count_documents({
-                "company_id": ObjectId(company_id),
-                "timestamp": {"$gte": start_date}
-            })
-            
-            # Service usage
+            # Total, service usage and intent distribution in one pass
             pipeline = [
-                {"$match": {
-                    "company_id": ObjectId(company_id),
-                    "timestamp": {"$gte": start_date},
-                    "service_id": {"$ne": None}
-                }},
-                {"$group": {"_id": "$service_id", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}}
-            ]
-            
-            service_usage = await self.db.ai_interactions.aggregate(pipeline).to_list(length=20)
-            
-            # Intent distribution
-            intent_pipeline = [
                 {"$match": {
                     "company_id": ObjectId(company_id),
                     "timestamp": {"$gte": start_date}
                 }},
-                {"$group": {"_id": "$intent", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}}
+                {"$facet": {
+                    "total": [{"$count": "count"}],
+                    "service_usage": [
+                        {"$match": {"service_id": {"$ne": None}}},
+                        {"$group": {"_id": "$service_id", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}},
+                        {"$limit": 20}
+                    ],
+                    "intent_distribution": [
+                        {"$group": {"_id": "$intent", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}},
+                        {"$limit": 10}
+                    ]
+                }}
             ]
             
-            intent_distribution = await self.db.ai_interactions.aggregate(intent_pipeline).to_list(length=10)
+            result = await self.db.ai_interactions.aggregate(pipeline).to_list(length=1)
+            facets = result[0] if result else {}
+            
+            total = facets.get("total") or [{"count": 0}]
+            total_interactions = total[0]["count"]
+            service_usage = facets.get("service_usage", [])
+            intent_distribution = facets.get("intent_distribution", [])
             
             return {
                 "total_interactions": total_interactions,
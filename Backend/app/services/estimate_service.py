@@ -1,16 +1,50 @@
 # app/services/estimate_service.py
 from typing import Optional, List, Dict, Any
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, time
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import logging
+import math
+import re
 
 from app.schemas.estimate import EstimateCreate, EstimateUpdate, EstimateSearch
-from app.models.estimate import Estimate, EstimateStatus, EstimateLineItem
+from app.models.estimate import Estimate, EstimateLineItem, EstimateStatus
 from app.core.config import settings
+from app.utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+def _as_datetime(value: Optional[date]) -> Optional[datetime]:
+    """Store dates as BSON datetimes (midnight) so they can be compared and indexed"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time.min)
+
+ESTIMATE_NUMBER_PREFIX = "EST-"
+
+# Inserts retried when the drawn estimate number is already taken
+ESTIMATE_NUMBER_ATTEMPTS = 3
+
+# Estimate fields the totals are calculated from
+TOTALS_FIELDS = ("line_items", "tax_rate", "discount_percentage")
+
+# Estimate fields used by _generate_pdf, send_estimate and _create_job_from_estimate
+PDF_FIELDS = {"estimate_number": 1}
+SEND_FIELDS = {"estimate_number": 1, "customer_id": 1, "pdf_url": 1}
+JOB_FIELDS = {"customer_id": 1, "title": 1, "total_amount": 1}
+
+# Contact fields shown alongside an estimate
+CUSTOMER_FIELDS = {"first_name": 1, "last_name": 1, "email": 1}
+
+# Customer name/email for single-estimate reads and sends, keyed by contact id
+_customer_cache = TTLCache(maxsize=4096, ttl=60)
+
+def invalidate_customer(customer_id: Any) -> None:
+    """Drop a cached customer after the contact is changed or deleted"""
+    _customer_cache.pop(str(customer_id))
+
 class EstimateService:
     """Service for estimate business logic"""
     
@@ -26,20 +60,18 @@ class EstimateService:
     ) -> Dict[str, Any]:
         """Create a new estimate"""
         try:
-            # Convert line items
-            line_items = []
-            for item_data in estimate_in.line_items:
-                line_item = EstimateLineItem(
-                    description=item_data.description,
-                    quantity=item_data.quantity,
-                    unit=item_data.unit or "each",
-                    unit_price=item_data.unit_price,
-                    total_price=item_data.quantity * item_data.unit_price,
-                    sku=item_data.sku,
-                    category=item_data.category,
-                    notes=item_data.notes
-                )
-                line_items.append(line_item)
+            # Convert line items; the request schema has already validated them
+            line_items = [{
+                "id": str(ObjectId()),
+                "description": item_data.description,
+                "quantity": item_data.quantity,
+                "unit": item_data.unit or "each",
+                "unit_price": item_data.unit_price,
+                "total_price": item_data.quantity * item_data.unit_price,
+                "sku": item_data.sku,
+                "category": item_data.category,
+                "notes": item_data.notes
+            } for item_data in estimate_in.line_items]
             
             # Create estimate data
             estimate_data = {
@@ -48,10 +80,10 @@ class EstimateService:
                 "title": estimate_in.title,
                 "description": estimate_in.description,
                 "status": EstimateStatus.DRAFT,
-                "line_items": [item.model_dump() for item in line_items],
+                "line_items": line_items,
                 "tax_rate": estimate_in.tax_rate or 0.0,
                 "discount_percentage": estimate_in.discount_percentage or 0.0,
-                "valid_until": estimate_in.valid_until,
+                "valid_until": _as_datetime(estimate_in.valid_until),
                 "terms_and_conditions": estimate_in.terms_and_conditions,
                 "payment_terms": estimate_in.payment_terms,
                 "custom_fields": estimate_in.custom_fields or {},
@@ -61,15 +93,22 @@ class EstimateService:
                 "updated_at": datetime.utcnow()
             }
             
-            # Generate estimate number
-            estimate_number = await self._generate_estimate_number(company_id)
-            estimate_data["estimate_number"] = estimate_number
-            
             # Calculate totals
             estimate_data = self._calculate_totals(estimate_data)
             
-            # Insert estimate
-            result = await self.collection.insert_one(estimate_data)
+            # Generate estimate number and insert; the unique index rejects a
+            # number that is already taken, and the counter is moved past it
+            for attempt in range(ESTIMATE_NUMBER_ATTEMPTS):
+                estimate_number = await self._generate_estimate_number()
+                estimate_data["estimate_number"] = estimate_number
+                try:
+                    result = await self.collection.insert_one(estimate_data)
+                    break
+                except DuplicateKeyError as e:
+                    if "estimate_number" not in str(e) or attempt == ESTIMATE_NUMBER_ATTEMPTS - 1:
+                        raise
+                    estimate_data.pop("_id", None)
+                    await self._seed_estimate_counter(estimate_number[len(ESTIMATE_NUMBER_PREFIX):].split("-")[0])
             estimate_data["_id"] = result.inserted_id
             
             logger.info(f"Created estimate {estimate_number} for company {company_id}")
@@ -116,13 +155,33 @@ class EstimateService:
             # Build query
             query = {"company_id": ObjectId(company_id)}
             
+            # Alternatives from separate filters are ANDed so one $or never
+            # replaces another
+            or_filters = []
+            
+            # Atlas Search stage, when the deployment has one configured
+            search_stages = []
+            
             # Add filters
             if search.q:
-                query["$or"] = [
-                    {"title": {"$regex": search.q, "$options": "i"}},
-                    {"estimate_number": {"$regex": search.q, "$options": "i"}},
-                    {"description": {"$regex": search.q, "$options": "i"}}
-                ]
+                number_prefix = search.q.strip().upper()
+                if number_prefix.startswith(ESTIMATE_NUMBER_PREFIX):
+                    # A (partial) estimate number; word search would match
+                    # the "EST" token in every number, so use an indexed prefix
+                    query["estimate_number"] = {"$regex": f"^{re.escape(number_prefix)}"}
+                elif settings.ESTIMATES_SEARCH_INDEX:
+                    search_stages.append({"$search": {
+                        "index": settings.ESTIMATES_SEARCH_INDEX,
+                        "compound": {
+                            "filter": [{"equals": {"path": "company_id", "value": ObjectId(company_id)}}],
+                            "must": [{"text": {
+                                "query": search.q,
+                                "path": ["title", "estimate_number", "description"]
+                            }}]
+                        }
+                    }})
+                else:
+                    query["$text"] = {"$search": search.q}
             
             if search.status:
                 query["status"] = search.status
@@ -143,32 +202,59 @@ class EstimateService:
                 query.setdefault("total_amount", {})["$lte"] = search.max_amount
             
             if search.expired is not None:
+                today = _as_datetime(date.today())
                 if search.expired:
-                    query["valid_until"] = {"$lt": date.today()}
+                    query["valid_until"] = {"$lt": today}
                 else:
-                    query["$or"] = [
-                        {"valid_until": {"$gte": date.today()}},
+                    or_filters.append([
+                        {"valid_until": {"$gte": today}},
                         {"valid_until": None}
-                    ]
+                    ])
             
-            # Count total documents
-            total = await self.collection.count_documents(query)
+            if len(or_filters) == 1:
+                query["$or"] = or_filters[0]
+            elif or_filters:
+                query["$and"] = [{"$or": alternatives} for alternatives in or_filters]
             
             # Calculate pagination
             skip = (search.page - 1) * search.size
-            pages = (total + search.size - 1) // search.size
             
             # Build sort
             sort_field = search.sort_by
             sort_direction = 1 if search.sort_order == "asc" else -1
             
-            # Execute query
-            cursor = self.collection.find(query).sort(sort_field, sort_direction).skip(skip).limit(search.size)
-            estimates = await cursor.to_list(length=search.size)
+            # Count and fetch the page, with each estimate's customer, in one
+            # round-trip
+            pipeline = search_stages + [
+                {"$match": query},
+                {"$facet": {
+                    "items": [
+                        {"$sort": {sort_field: sort_direction}},
+                        {"$skip": skip},
+                        {"$limit": search.size},
+                        {"$lookup": {
+                            "from": "contacts",
+                            "localField": "customer_id",
+                            "foreignField": "_id",
+                            "pipeline": [{"$project": CUSTOMER_FIELDS}],
+                            "as": "_customer"
+                        }},
+                        {"$unwind": {"path": "$_customer", "preserveNullAndEmptyArrays": True}}
+                    ],
+                    "total": [{"$count": "count"}]
+                }}
+            ]
+            # Sorting on a field without a matching index may exceed the
+            # in-memory sort limit on large companies; let it spill to disk
+            result = await self.collection.aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+            
+            facets = result[0] if result else {"items": [], "total": []}
+            total = facets["total"][0]["count"] if facets["total"] else 0
+            pages = (total + search.size - 1) // search.size
+            estimates = facets["items"]
             
-            # Populate customer info
             for estimate in estimates:
-                estimate = await self._populate_customer_info(estimate)
+                self._apply_customer_info(estimate, estimate.pop("_customer", None))
             
             # Format response
             return {
@@ -196,6 +282,9 @@ class EstimateService:
             if not ObjectId.is_valid(estimate_id):
                 return None
             
+            estimate_oid = ObjectId(estimate_id)
+            company_oid = ObjectId(company_id)
+            
             # Build update data
             update_data = {"updated_at": datetime.utcnow()}
             
@@ -216,7 +305,7 @@ class EstimateService:
                 update_data["discount_percentage"] = estimate_in.discount_percentage
             
             if estimate_in.valid_until is not None:
-                update_data["valid_until"] = estimate_in.valid_until
+                update_data["valid_until"] = _as_datetime(estimate_in.valid_until)
             
             if estimate_in.terms_and_conditions is not None:
                 update_data["terms_and_conditions"] = estimate_in.terms_and_conditions
@@ -230,59 +319,60 @@ class EstimateService:
             if estimate_in.notes is not None:
                 update_data["notes"] = estimate_in.notes
             
-            # Update line items if provided
+            # Update line items if provided; update items have optional
+            # fields, so they are validated through the model before storing
             if estimate_in.line_items is not None:
-                line_items = []
-                for item_data in estimate_in.line_items:
-                    line_item = EstimateLineItem(
-                        description=item_data.description or "",
-                        quantity=item_data.quantity or 1,
-                        unit=item_data.unit or "each",
-                        unit_price=item_data.unit_price or 0,
-                        total_price=(item_data.quantity or 1) * (item_data.unit_price or 0),
-                        sku=item_data.sku,
-                        category=item_data.category,
-                        notes=item_data.notes
-                    )
-                    line_items.append(line_item)
-                
-                update_data["line_items"] = [item.model_dump() for item in line_items]
+                update_data["line_items"] = [EstimateLineItem(
+                    description=item_data.description or "",
+                    quantity=item_data.quantity or 1,
+                    unit=item_data.unit or "each",
+                    unit_price=item_data.unit_price or 0,
+                    total_price=(item_data.quantity or 1) * (item_data.unit_price or 0),
+                    sku=item_data.sku,
+                    category=item_data.category,
+                    notes=item_data.notes
+                ).model_dump() for item_data in estimate_in.line_items]
             
             # Recalculate totals if line items or rates changed
-            if any(field in update_data for field in ["line_items", "tax_rate", "discount_percentage"]):
-                # Get current estimate to recalculate
-                current_estimate = await self.collection.find_one({
-                    "_id": ObjectId(estimate_id),
-                    "company_id": ObjectId(company_id)
-                })
+            if any(field in update_data for field in TOTALS_FIELDS):
+                totals_input = {field: update_data[field] for field in TOTALS_FIELDS if field in update_data}
                 
-                if current_estimate:
-                    # Merge update data with current data
-                    for key, value in update_data.items():
-                        current_estimate[key] = value
-                    
-                    # Recalculate totals
-                    current_estimate = self._calculate_totals(current_estimate)
+                # Read only the inputs the update doesn't already carry
+                missing = [field for field in TOTALS_FIELDS if field not in totals_input]
+                current_estimate = {}
+                if missing:
+                    current_estimate = await self.collection.find_one(
+                        {"_id": estimate_oid, "company_id": company_oid},
+                        {field: 1 for field in missing}
+                    )
+                
+                if current_estimate is not None:
+                    totals_input.update({
+                        field: current_estimate[field] for field in missing if field in current_estimate
+                    })
+                    totals_input = self._calculate_totals(totals_input)
                     
                     # Update totals in update_data
                     update_data.update({
-                        "subtotal": current_estimate["subtotal"],
-                        "tax_amount": current_estimate["tax_amount"],
-                        "discount_amount": current_estimate["discount_amount"],
-                        "total_amount": current_estimate["total_amount"]
+                        "subtotal": totals_input["subtotal"],
+                        "tax_amount": totals_input["tax_amount"],
+                        "discount_amount": totals_input["discount_amount"],
+                        "total_amount": totals_input["total_amount"]
                     })
             
-            # Update estimate
-            result = await self.collection.update_one(
-                {"_id": ObjectId(estimate_id), "company_id": ObjectId(company_id)},
-                {"$set": update_data}
+            # Update estimate and get the updated document back
+            estimate = await self.collection.find_one_and_update(
+                {"_id": estimate_oid, "company_id": company_oid},
+                {"$set": update_data},
+                return_document=ReturnDocument.AFTER
             )
             
-            if result.modified_count == 0:
+            if not estimate:
                 return None
             
-            # Return updated estimate
-            return await self.get_estimate(estimate_id, company_id)
+            estimate = await self._populate_customer_info(estimate)
+            
+            return self._format_estimate_response(estimate)
             
         except Exception as e:
             logger.error(f"Error updating estimate {estimate_id}: {e}")
@@ -320,11 +410,14 @@ class EstimateService:
             if not ObjectId.is_valid(estimate_id):
                 return False
             
+            estimate_oid = ObjectId(estimate_id)
+            company_oid = ObjectId(company_id)
+            
             # Get estimate
-            estimate = await self.collection.find_one({
-                "_id": ObjectId(estimate_id),
-                "company_id": ObjectId(company_id)
-            })
+            estimate = await self.collection.find_one(
+                {"_id": estimate_oid, "company_id": company_oid},
+                SEND_FIELDS
+            )
             
             if not estimate:
                 return False
@@ -333,15 +426,13 @@ class EstimateService:
             if not estimate.get("pdf_url"):
                 pdf_url = await self._generate_pdf(estimate)
                 await self.collection.update_one(
-                    {"_id": ObjectId(estimate_id)},
+                    {"_id": estimate_oid},
                     {"$set": {"pdf_url": pdf_url}}
                 )
                 estimate["pdf_url"] = pdf_url
             
             # Get customer info
-            customer = await self.db.contacts.find_one({
-                "_id": estimate["customer_id"]
-            })
+            customer = await self._get_customer(estimate["customer_id"])
             
             if not customer or not customer.get("email"):
                 logger.error(f"Customer not found or no email for estimate {estimate_id}")
@@ -349,13 +440,14 @@ class EstimateService:
             
             # Send email (would integrate with email service)
             # For now, just update the sent status
+            now = datetime.utcnow()
             await self.collection.update_one(
-                {"_id": ObjectId(estimate_id)},
+                {"_id": estimate_oid},
                 {
                     "$set": {
                         "status": EstimateStatus.SENT,
-                        "sent_at": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
+                        "sent_at": now,
+                        "updated_at": now
                     }
                 }
             )
@@ -377,31 +469,29 @@ class EstimateService:
             if not ObjectId.is_valid(estimate_id):
                 return None
             
-            # Update estimate status
-            result = await self.collection.update_one(
-                {"_id": ObjectId(estimate_id), "company_id": ObjectId(company_id)},
+            estimate_oid = ObjectId(estimate_id)
+            company_oid = ObjectId(company_id)
+            
+            # Update estimate status and get back what the job needs
+            now = datetime.utcnow()
+            estimate = await self.collection.find_one_and_update(
+                {"_id": estimate_oid, "company_id": company_oid},
                 {
                     "$set": {
                         "status": EstimateStatus.ACCEPTED,
-                        "accepted_at": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
+                        "accepted_at": now,
+                        "updated_at": now
                     }
-                }
+                },
+                projection=JOB_FIELDS,
+                return_document=ReturnDocument.AFTER
             )
             
-            if result.modified_count == 0:
+            if not estimate:
                 return None
             
             # Create job from estimate
-            estimate = await self.collection.find_one({
-                "_id": ObjectId(estimate_id)
-            })
-            
-            if estimate:
-                job_data = await self._create_job_from_estimate(estimate)
-                return job_data
-            
-            return None
+            return await self._create_job_from_estimate(estimate)
             
         except Exception as e:
             logger.error(f"Error accepting estimate {estimate_id}: {e}")
@@ -418,10 +508,11 @@ class EstimateService:
             if not ObjectId.is_valid(estimate_id):
                 return False
             
+            now = datetime.utcnow()
             update_data = {
                 "status": EstimateStatus.DECLINED,
-                "declined_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
+                "declined_at": now,
+                "updated_at": now
             }
             
             if reason:
@@ -448,10 +539,13 @@ class EstimateService:
             if not ObjectId.is_valid(estimate_id):
                 return None
             
-            estimate = await self.collection.find_one({
-                "_id": ObjectId(estimate_id),
-                "company_id": ObjectId(company_id)
-            })
+            estimate_oid = ObjectId(estimate_id)
+            company_oid = ObjectId(company_id)
+            
+            estimate = await self.collection.find_one(
+                {"_id": estimate_oid, "company_id": company_oid},
+                PDF_FIELDS
+            )
             
             if not estimate:
                 return None
@@ -460,7 +554,7 @@ class EstimateService:
             
             # Update estimate with PDF URL
             await self.collection.update_one(
-                {"_id": ObjectId(estimate_id)},
+                {"_id": estimate_oid},
                 {"$set": {"pdf_url": pdf_url, "updated_at": datetime.utcnow()}}
             )
             
@@ -471,37 +565,68 @@ class EstimateService:
             raise
     
     # Private helper methods
-    async def _generate_estimate_number(self, company_id: str) -> str:
-        """Generate unique estimate number"""
+    async def _generate_estimate_number(self) -> str:
+        """Reserve the next estimate number from the daily counter.
+        
+        Estimate numbers are unique across all companies, so there is one
+        counter per day rather than one per company and day.
+        """
         today = datetime.now().strftime("%Y%m%d")
         
-        # Count estimates created today
-        start_of_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day = start_of_day + timedelta(days=1)
+        # Atomic daily sequence; concurrent creates never share a number
+        # and nothing has to count today's estimates
+        counter = await self.db.counters.find_one_and_update(
+            {"_id": f"estimate:{today}"},
+            {"$inc": {"seq": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if counter is None:
+            await self._seed_estimate_counter(today)
+            counter = await self.db.counters.find_one_and_update(
+                {"_id": f"estimate:{today}"},
+                {"$inc": {"seq": 1}},
+                return_document=ReturnDocument.AFTER
+            )
         
-        count = await self.collection.count_documents({
-            "company_id": ObjectId(company_id),
-            "created_at": {"$gte": start_of_day, "$lt": end_of_day}
-        })
+        return f"{ESTIMATE_NUMBER_PREFIX}{today}-{counter['seq']:04d}"
+    
+    async def _seed_estimate_counter(self, day: str) -> None:
+        """Move a daily counter past the highest estimate number already used.
         
-        sequence = count + 1
-        return f"EST-{today}-{sequence:04d}"
+        Numbers issued before the counter existed are found through the
+        unique estimate_number index. The suffix is compared as a number,
+        since "10000" sorts before "9999" as a string. $max with upsert
+        never moves the counter back, so concurrent seeds are safe.
+        """
+        prefix = f"{ESTIMATE_NUMBER_PREFIX}{day}-"
+        highest = await self.collection.aggregate([
+            {"$match": {"estimate_number": {"$regex": f"^{re.escape(prefix)}\\d+$"}}},
+            {"$group": {
+                "_id": None,
+                "last": {"$max": {"$toLong": {"$substrCP": ["$estimate_number", len(prefix), 20]}}}
+            }}
+        ]).to_list(1)
+        last = highest[0]["last"] if highest else 0
+        
+        await self.db.counters.update_one(
+            {"_id": f"estimate:{day}"},
+            {"$max": {"seq": last}},
+            upsert=True
+        )
     
     def _calculate_totals(self, estimate_data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate estimate totals"""
         line_items = estimate_data.get("line_items", [])
         
-        # Calculate subtotal
-        subtotal = sum(item.get("total_price", 0) for item in line_items)
+        # Calculate subtotal; fsum stays exact however many items there are
+        subtotal = math.fsum([item.get("total_price", 0) for item in line_items])
         
         # Calculate discount
-        discount_percentage = estimate_data.get("discount_percentage", 0)
-        discount_amount = subtotal * (discount_percentage / 100)
+        discount_amount = subtotal * (estimate_data.get("discount_percentage", 0) / 100)
         
         # Calculate tax
         taxable_amount = subtotal - discount_amount
-        tax_rate = estimate_data.get("tax_rate", 0)
-        tax_amount = taxable_amount * (tax_rate / 100)
+        tax_amount = taxable_amount * (estimate_data.get("tax_rate", 0) / 100)
         
         # Calculate total
         total_amount = taxable_amount + tax_amount
@@ -518,20 +643,33 @@ class EstimateService:
     async def _populate_customer_info(self, estimate: Dict[str, Any]) -> Dict[str, Any]:
         """Populate customer information"""
         try:
-            customer = await self.db.contacts.find_one({
-                "_id": estimate["customer_id"]
-            })
+            customer = await self._get_customer(estimate["customer_id"])
             
-            if customer:
-                estimate["customer_name"] = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip()
-                estimate["customer_email"] = customer.get("email")
-            
-            return estimate
+            return self._apply_customer_info(estimate, customer)
             
         except Exception as e:
             logger.error(f"Error populating customer info: {e}")
             return estimate
     
+    async def _get_customer(self, customer_id: ObjectId) -> Optional[Dict[str, Any]]:
+        """Customer name and email, cached for up to a minute"""
+        return await _customer_cache.get_or_load(
+            str(customer_id),
+            lambda: self.db.contacts.find_one({"_id": customer_id}, CUSTOMER_FIELDS)
+        )
+    
+    def _apply_customer_info(
+        self,
+        estimate: Dict[str, Any],
+        customer: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Set customer name and email on an estimate"""
+        if customer:
+            estimate["customer_name"] = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip()
+            estimate["customer_email"] = customer.get("email")
+        
+        return estimate
+    
     async def _generate_pdf(self, estimate: Dict[str, Any]) -> str:
         """Generate PDF document"""
         # This would integrate with a PDF generation service
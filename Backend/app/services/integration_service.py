@@ -1,6 +1,8 @@
 # backend/app/services/integration_service.py
+import asyncio
 import secrets
 import hashlib
+import hmac
 import time
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
@@ -12,6 +14,8 @@ import json
 
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.utils.log_queue import LogQueue
+from app.utils.ttl_cache import TTLCache
 from app.models.integration import (
     Integration, IntegrationProvider, Webhook, IntegrationLog, 
     ApiKey, SyncResult, IntegrationStatus, IntegrationType, AuthType
@@ -23,121 +27,225 @@ from app.schemas.integration import (
 
 logger = get_logger(__name__)
 
+def _to_bytes(value: Any) -> bytes:
+    return value if isinstance(value, bytes) else value.encode()
+
+def _to_str(value: Any) -> str:
+    return value if isinstance(value, str) else value.decode()
+
+class _RFernetCipher:
+    """rfernet behind the cryptography Fernet API.
+    
+    rfernet writes the same tokens but returns them from encrypt() as str
+    and takes them as str in decrypt(); this keeps bytes in and bytes out.
+    """
+    
+    def __init__(self, key: str):
+        self._fernet = _RFernet(key)
+    
+    def encrypt(self, data: bytes) -> bytes:
+        return _to_bytes(self._fernet.encrypt(_to_bytes(data)))
+    
+    def decrypt(self, token: bytes) -> bytes:
+        return _to_bytes(self._fernet.decrypt(_to_str(token)))
+
+# rfernet is a Rust build of Fernet with the same token format; use it
+# when installed
+try:
+    from rfernet import Fernet as _RFernet
+    _Fernet = _RFernetCipher
+except ImportError:
+    _Fernet = Fernet
+
+# Parsing the key once instead of on every service instantiation
+_ENCRYPTION_KEY = getattr(settings, "ENCRYPTION_KEY", None)
+_cipher_suite = _Fernet(_ENCRYPTION_KEY) if _ENCRYPTION_KEY else None
+
+def _config_hash(config_dict: Dict[str, Any]) -> str:
+    """Digest of a submitted config, used to spot unchanged updates.
+    
+    Keyed with the encryption key so the stored digest can't be used to
+    check guesses of the secrets it covers.
+    """
+    payload = json.dumps(config_dict, sort_keys=True, default=str).encode()
+    key = _ENCRYPTION_KEY.encode() if _ENCRYPTION_KEY else b""
+    return hmac.digest(key, payload, "sha256")[:16].hex()
+
+# Marks a config value that could not be decrypted
+_DECRYPT_FAILED = object()
+
+# Decrypted configs keyed by (integration_id, company_id). Entries are
+# dropped when this process updates or deletes the integration; other
+# workers may keep the old config until the TTL runs out
+_config_cache = TTLCache(maxsize=1024, ttl=300)
+
+# Post-create connection tests in flight; holding a reference keeps the
+# tasks from being garbage collected before they finish
+_background_tasks: set = set()
+
+# Provider checks share one connection pool so repeated tests against the
+# same API reuse warm TLS connections
+_http_client: Optional[httpx.AsyncClient] = None
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Shared HTTP client for provider API calls"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=50)
+        )
+    return _http_client
+
+# Integration logs are written in batches off the request path
+_integration_log = LogQueue("integration_logs", interval=0.5, batch_size=100, maxsize=10000)
+
+async def close_integration_clients() -> None:
+    """Write queued integration logs and close the provider HTTP client on shutdown"""
+    global _http_client
+    await _integration_log.close()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# Available integration providers, built once at import
+_PROVIDERS: Dict[str, IntegrationProvider] = {
+    "stripe": IntegrationProvider(
+        id="stripe",
+        name="Stripe",
+        type=IntegrationType.PAYMENT,
+        description="Accept online payments and manage subscriptions",
+        logo_url="/logos/stripe.png",
+        auth_type=AuthType.API_KEY,
+        required_fields=[
+            {"key": "publishable_key", "label": "Publishable Key", "type": "text", "required": True},
+            {"key": "secret_key", "label": "Secret Key", "type": "password", "required": True},
+            {"key": "webhook_secret", "label": "Webhook Secret", "type": "password", "required": False}
+        ],
+        documentation_url="https://docs.stripe.com",
+        features=["Online payments", "Recurring billing", "Payment processing", "Fraud protection"]
+    ),
+    "twilio": IntegrationProvider(
+        id="twilio",
+        name="Twilio",
+        type=IntegrationType.COMMUNICATION,
+        description="Send SMS notifications and automate conversations",
+        logo_url="/logos/twilio.png",
+        auth_type=AuthType.API_KEY,
+        required_fields=[
+            {"key": "account_sid", "label": "Account SID", "type": "text", "required": True},
+            {"key": "auth_token", "label": "Auth Token", "type": "password", "required": True},
+            {"key": "phone_number", "label": "Phone Number", "type": "text", "required": True}
+        ],
+        documentation_url="https://docs.twilio.com",
+        features=["SMS messaging", "Voice calls", "Conversation AI", "Phone verification"]
+    ),
+    "quickbooks": IntegrationProvider(
+        id="quickbooks",
+        name="QuickBooks Online",
+        type=IntegrationType.ACCOUNTING,
+        description="Sync invoices, payments, and financial data with QuickBooks",
+        logo_url="/logos/quickbooks.png",
+        auth_type=AuthType.OAUTH2,
+        required_fields=[
+            {"key": "client_id", "label": "Client ID", "type": "text", "required": True},
+            {"key": "client_secret", "label": "Client Secret", "type": "password", "required": True},
+            {"key": "sandbox", "label": "Sandbox Mode", "type": "checkbox", "required": False}
+        ],
+        setup_url="https://developer.intuit.com/app/developer/qbo/docs/get-started",
+        documentation_url="https://developer.intuit.com/app/developer/qbo/docs/api/accounting",
+        features=["Invoice sync", "Payment tracking", "Customer sync", "Financial reporting"]
+    ),
+    "google_calendar": IntegrationProvider(
+        id="google_calendar",
+        name="Google Calendar",
+        type=IntegrationType.PRODUCTIVITY,
+        description="Sync appointments and schedules with Google Calendar",
+        logo_url="/logos/google-calendar.png",
+        auth_type=AuthType.OAUTH2,
+        required_fields=[
+            {"key": "client_id", "label": "Client ID", "type": "text", "required": True},
+            {"key": "client_secret", "label": "Client Secret", "type": "password", "required": True},
+            {"key": "api_key", "label": "API Key", "type": "password", "required": True}
+        ],
+        setup_url="https://console.cloud.google.com/apis/credentials",
+        documentation_url="https://developers.google.com/calendar",
+        features=["Calendar sync", "Appointment scheduling", "Reminder notifications"]
+    ),
+    "mailchimp": IntegrationProvider(
+        id="mailchimp",
+        name="Mailchimp",
+        type=IntegrationType.MARKETING,
+        description="Sync customer data and automate email marketing",
+        logo_url="/logos/mailchimp.png",
+        auth_type=AuthType.API_KEY,
+        required_fields=[
+            {"key": "api_key", "label": "API Key", "type": "password", "required": True},
+            {"key": "server_prefix", "label": "Server Prefix", "type": "text", "required": True, "description": "e.g., us1, us2"}
+        ],
+        documentation_url="https://mailchimp.com/developer/",
+        features=["Email campaigns", "Customer segmentation", "Automation workflows"]
+    ),
+    "zapier": IntegrationProvider(
+        id="zapier",
+        name="Zapier",
+        type=IntegrationType.AUTOMATION,
+        description="Connect with 5000+ apps through automated workflows",
+        logo_url="/logos/zapier.png",
+        auth_type=AuthType.WEBHOOK,
+        required_fields=[
+            {"key": "webhook_urls", "label": "Webhook URLs", "type": "textarea", "required": True, "description": "JSON array of webhook configurations"}
+        ],
+        documentation_url="https://zapier.com/developer",
+        features=["Workflow automation", "App connections", "Data sync", "Trigger actions"]
+    ),
+    "google_maps": IntegrationProvider(
+        id="google_maps",
+        name="Google Maps",
+        type=IntegrationType.MAPPING,
+        description="Route optimization and location services",
+        logo_url="/logos/google-maps.png",
+        auth_type=AuthType.API_KEY,
+        required_fields=[
+            {"key": "api_key", "label": "API Key", "type": "password", "required": True}
+        ],
+        setup_url="https://console.cloud.google.com/apis/credentials",
+        documentation_url="https://developers.google.com/maps",
+        features=["Route optimization", "Geocoding", "Distance calculation", "Map display"]
+    )
+}
+
+# Password field keys per provider, so splitting a config is a set lookup
+_PASSWORD_KEYS: Dict[str, frozenset] = {
+    provider_id: frozenset(
+        field["key"] for field in provider.required_fields if field["type"] == "password"
+    )
+    for provider_id, provider in _PROVIDERS.items()
+}
+
+# IntegrationService methods for connection tests and data syncs by provider
+_TESTERS = {
+    "stripe": "_test_stripe",
+    "twilio": "_test_twilio",
+    "quickbooks": "_test_quickbooks",
+    "google_calendar": "_test_google_calendar",
+    "mailchimp": "_test_mailchimp",
+    "google_maps": "_test_google_maps"
+}
+# Add other provider sync methods as needed
+_SYNCERS = {
+    "stripe": "_sync_stripe",
+    "quickbooks": "_sync_quickbooks"
+}
+
 class IntegrationService:
     """Service for managing third-party integrations"""
     
     def __init__(self, database: AsyncIOMotorDatabase):
         self.db = database
-        self.cipher_suite = Fernet(settings.ENCRYPTION_KEY.encode()) if hasattr(settings, 'ENCRYPTION_KEY') else None
-        self._load_providers()
-    
-    def _load_providers(self):
-        """Load available integration providers"""
-        self.providers = {
-            "stripe": IntegrationProvider(
-                id="stripe",
-                name="Stripe",
-                type=IntegrationType.PAYMENT,
-                description="Accept online payments and manage subscriptions",
-                logo_url="/logos/stripe.png",
-                auth_type=AuthType.API_KEY,
-                required_fields=[
-                    {"key": "publishable_key", "label": "Publishable Key", "type": "text", "required": True},
-                    {"key": "secret_key", "label": "Secret Key", "type": "password", "required": True},
-                    {"key": "webhook_secret", "label": "Webhook Secret", "type": "password", "required": False}
-                ],
-                documentation_url="https://docs.stripe.com",
-                features=["Online payments", "Recurring billing", "Payment processing", "Fraud protection"]
-            ),
-            "twilio": IntegrationProvider(
-                id="twilio",
-                name="Twilio",
-                type=IntegrationType.COMMUNICATION,
-                description="Send SMS notifications and automate conversations",
-                logo_url="/logos/twilio.png",
-                auth_type=AuthType.API_KEY,
-                required_fields=[
-                    {"key": "account_sid", "label": "Account SID", "type": "text", "required": True},
-                    {"key": "auth_token", "label": "Auth Token", "type": "password", "required": True},
-                    {"key": "phone_number", "label": "Phone Number", "type": "text", "required": True}
-                ],
-                documentation_url="https://docs.twilio.com",
-                features=["SMS messaging", "Voice calls", "Conversation AI", "Phone verification"]
-            ),
-            "quickbooks": IntegrationProvider(
-                id="quickbooks",
-                name="QuickBooks Online",
-                type=IntegrationType.ACCOUNTING,
-                description="Sync invoices, payments, and financial data with QuickBooks",
-                logo_url="/logos/quickbooks.png",
-                auth_type=AuthType.OAUTH2,
-                required_fields=[
-                    {"key": "client_id", "label": "Client ID", "type": "text", "required": True},
-                    {"key": "client_secret", "label": "Client Secret", "type": "password", "required": True},
-                    {"key": "sandbox", "label": "Sandbox Mode", "type": "checkbox", "required": False}
-                ],
-                setup_url="https://developer.intuit.com/app/developer/qbo/docs/get-started",
-                documentation_url="https://developer.intuit.com/app/developer/qbo/docs/api/accounting",
-                features=["Invoice sync", "Payment tracking", "Customer sync", "Financial reporting"]
-            ),
-            "google_calendar": IntegrationProvider(
-                id="google_calendar",
-                name="Google Calendar",
-                type=IntegrationType.PRODUCTIVITY,
-                description="Sync appointments and schedules with Google Calendar",
-                logo_url="/logos/google-calendar.png",
-                auth_type=AuthType.OAUTH2,
-                required_fields=[
-                    {"key": "client_id", "label": "Client ID", "type": "text", "required": True},
-                    {"key": "client_secret", "label": "Client Secret", "type": "password", "required": True},
-                    {"key": "api_key", "label": "API Key", "type": "password", "required": True}
-                ],
-                setup_url="https://console.cloud.google.com/apis/credentials",
-                documentation_url="https://developers.google.com/calendar",
-                features=["Calendar sync", "Appointment scheduling", "Reminder notifications"]
-            ),
-            "mailchimp": IntegrationProvider(
-                id="mailchimp",
-                name="Mailchimp",
-                type=IntegrationType.MARKETING,
-                description="Sync customer data and automate email marketing",
-                logo_url="/logos/mailchimp.png",
-                auth_type=AuthType.API_KEY,
-                required_fields=[
-                    {"key": "api_key", "label": "API Key", "type": "password", "required": True},
-                    {"key": "server_prefix", "label": "Server Prefix", "type": "text", "required": True, "description": "e.g., us1, us2"}
-                ],
-                documentation_url="https://mailchimp.com/developer/",
-                features=["Email campaigns", "Customer segmentation", "Automation workflows"]
-            ),
-            "zapier": IntegrationProvider(
-                id="zapier",
-                name="Zapier",
-                type=IntegrationType.AUTOMATION,
-                description="Connect with 5000+ apps through automated workflows",
-                logo_url="/logos/zapier.png",
-                auth_type=AuthType.WEBHOOK,
-                required_fields=[
-                    {"key": "webhook_urls", "label": "Webhook URLs", "type": "textarea", "required": True, "description": "JSON array of webhook configurations"}
-                ],
-                documentation_url="https://zapier.com/developer",
-                features=["Workflow automation", "App connections", "Data sync", "Trigger actions"]
-            ),
-            "google_maps": IntegrationProvider(
-                id="google_maps",
-                name="Google Maps",
-                type=IntegrationType.MAPPING,
-                description="Route optimization and location services",
-                logo_url="/logos/google-maps.png",
-                auth_type=AuthType.API_KEY,
-                required_fields=[
-                    {"key": "api_key", "label": "API Key", "type": "password", "required": True}
-                ],
-                setup_url="https://console.cloud.google.com/apis/credentials",
-                documentation_url="https://developers.google.com/maps",
-                features=["Route optimization", "Geocoding", "Distance calculation", "Map display"]
-            )
-        }
+        self.cipher_suite = _cipher_suite
+        self.providers = _PROVIDERS
+        self._password_keys = _PASSWORD_KEYS
     
     # Provider Management
     async def get_providers(self) -> List[IntegrationProvider]:
@@ -153,18 +261,11 @@ class IntegrationService:
         """Get all integrations for a company"""
         try:
             collection = self.db.integrations
-            cursor = collection.find({"company_id": company_id})
-            integrations = []
+            # Don't return encrypted config
+            cursor = collection.find({"company_id": company_id}, {"encrypted_config": 0})
+            docs = await cursor.to_list(length=None)
             
-            async for doc in cursor:
-                doc["id"] = str(doc["_id"])
-                del doc["_id"]
-                # Don't return encrypted config
-                if "encrypted_config" in doc:
-                    del doc["encrypted_config"]
-                integrations.append(Integration(**doc))
-            
-            return integrations
+            return [Integration(**{**doc, "_id": str(doc["_id"])}) for doc in docs]
         except Exception as e:
             logger.error(f"Error getting integrations: {e}")
             return []
@@ -204,23 +305,8 @@ class IntegrationService:
                 raise ValueError(f"Provider {provider_id} not found")
             
             # Encrypt sensitive config
-            encrypted_config = {}
-            safe_config = {}
-            
-            config_dict = config.dict()
-            for key, value in config_dict.items():
-                if value is None:
-                    continue
-                    
-                # Encrypt sensitive fields
-                if any(field["key"] == key and field["type"] == "password" 
-                       for field in provider.required_fields):
-                    if self.cipher_suite:
-                        encrypted_config[key] = self.cipher_suite.encrypt(str(value).encode()).decode()
-                    else:
-                        encrypted_config[key] = value  # Fallback if no encryption
-                else:
-                    safe_config[key] = value
+            config_dict = config.model_dump(exclude_none=True)
+            safe_config, encrypted_config = self._split_config(provider, config_dict)
             
             integration = Integration(
                 company_id=company_id,
@@ -230,6 +316,7 @@ class IntegrationService:
                 status=IntegrationStatus.PENDING,
                 config=safe_config,
                 encrypted_config=encrypted_config,
+                config_hash=_config_hash(config_dict),
                 created_by=user_id,
                 webhook_url=config.webhook_url
             )
@@ -238,23 +325,11 @@ class IntegrationService:
             result = await collection.insert_one(integration.dict(by_alias=True, exclude={"id"}))
             integration.id = str(result.inserted_id)
             
-            # Test the integration
-            test_result = await self.test_integration(integration.id, company_id)
-            if test_result.success:
-                await self.update_integration_status(integration.id, IntegrationStatus.CONNECTED)
-                integration.status = IntegrationStatus.CONNECTED
-            else:
-                await self.update_integration_status(integration.id, IntegrationStatus.ERROR, test_result.message)
-                integration.status = IntegrationStatus.ERROR
-                integration.last_error = test_result.message
-            
-            await self.log_integration_action(
-                integration.id, 
-                company_id, 
-                "integration_created",
-                "success" if test_result.success else "error",
-                f"Integration created and {'connected' if test_result.success else 'failed to connect'}"
-            )
+            # Test the connection in the background; the integration is
+            # returned as pending and its status settles once the test ends
+            task = asyncio.create_task(self._post_create_test(integration.id, company_id, provider_id, config_dict))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
             
             return integration
             
@@ -262,6 +337,44 @@ class IntegrationService:
             logger.error(f"Error creating integration: {e}")
             raise
     
+    async def _post_create_test(
+        self,
+        integration_id: str,
+        company_id: str,
+        provider_id: str,
+        full_config: Dict[str, Any]
+    ):
+        """Test a newly created integration and record the outcome"""
+        try:
+            # Test the integration with the plaintext config already in hand
+            test_result = await self._run_provider_test(provider_id, full_config)
+            
+            # Only settle a still-pending status, so a config update that
+            # finished its own test first is not overwritten
+            if test_result.success:
+                status_update = self.update_integration_status(
+                    integration_id, IntegrationStatus.CONNECTED,
+                    expected_status=IntegrationStatus.PENDING
+                )
+            else:
+                status_update = self.update_integration_status(
+                    integration_id, IntegrationStatus.ERROR, test_result.message,
+                    expected_status=IntegrationStatus.PENDING
+                )
+            
+            await asyncio.gather(
+                status_update,
+                self.log_integration_action(
+                    integration_id, 
+                    company_id, 
+                    "integration_created",
+                    "success" if test_result.success else "error",
+                    f"Integration created and {'connected' if test_result.success else 'failed to connect'}"
+                )
+            )
+        except Exception as e:
+            logger.error(f"Error testing new integration: {e}")
+    
     async def update_integration_config(
         self, 
         integration_id: str, 
@@ -278,28 +391,21 @@ class IntegrationService:
             if not provider:
                 raise ValueError("Provider not found")
             
+            # Nothing to re-encrypt or re-test when a connected integration
+            # is saved with the same config
+            config_dict = config.model_dump(exclude_none=True)
+            config_hash = _config_hash(config_dict)
+            if config_hash == integration.config_hash and integration.status == IntegrationStatus.CONNECTED:
+                return integration
+            
             # Encrypt sensitive config
-            encrypted_config = {}
-            safe_config = {}
-            
-            config_dict = config.dict()
-            for key, value in config_dict.items():
-                if value is None:
-                    continue
-                    
-                if any(field["key"] == key and field["type"] == "password" 
-                       for field in provider.required_fields):
-                    if self.cipher_suite:
-                        encrypted_config[key] = self.cipher_suite.encrypt(str(value).encode()).decode()
-                    else:
-                        encrypted_config[key] = value
-                else:
-                    safe_config[key] = value
+            safe_config, encrypted_config = self._split_config(provider, config_dict)
             
             # Update integration
             update_data = {
                 "config": safe_config,
                 "encrypted_config": encrypted_config,
+                "config_hash": config_hash,
                 "updated_at": datetime.utcnow(),
                 "webhook_url": config.webhook_url
             }
@@ -309,20 +415,24 @@ class IntegrationService:
                 {"_id": ObjectId(integration_id), "company_id": company_id},
                 {"$set": update_data}
             )
+            _config_cache.pop((integration_id, company_id))
             
             # Test updated configuration
-            test_result = await self.test_integration(integration_id, company_id)
+            test_result = await self._run_provider_test(integration.provider_id, config_dict)
             if test_result.success:
-                await self.update_integration_status(integration_id, IntegrationStatus.CONNECTED)
+                status_update = self.update_integration_status(integration_id, IntegrationStatus.CONNECTED)
             else:
-                await self.update_integration_status(integration_id, IntegrationStatus.ERROR, test_result.message)
+                status_update = self.update_integration_status(integration_id, IntegrationStatus.ERROR, test_result.message)
             
-            await self.log_integration_action(
-                integration_id, 
-                company_id, 
-                "config_updated",
-                "success" if test_result.success else "error",
-                f"Configuration updated and {'connected' if test_result.success else 'failed to connect'}"
+            await asyncio.gather(
+                status_update,
+                self.log_integration_action(
+                    integration_id, 
+                    company_id, 
+                    "config_updated",
+                    "success" if test_result.success else "error",
+                    f"Configuration updated and {'connected' if test_result.success else 'failed to connect'}"
+                )
             )
             
             return await self.get_integration(integration_id, company_id)
@@ -341,6 +451,7 @@ class IntegrationService:
             })
             
             if result.deleted_count > 0:
+                _config_cache.pop((integration_id, company_id))
                 await self.log_integration_action(
                     integration_id, 
                     company_id, 
@@ -359,9 +470,10 @@ class IntegrationService:
         self, 
         integration_id: str, 
         status: IntegrationStatus, 
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        expected_status: Optional[IntegrationStatus] = None
     ):
-        """Update integration status"""
+        """Update integration status, optionally only if it still has expected_status"""
         try:
             update_data = {
                 "status": status.value,
@@ -374,11 +486,12 @@ class IntegrationService:
             elif status == IntegrationStatus.ERROR and error_message:
                 update_data["last_error"] = error_message
             
+            query = {"_id": ObjectId(integration_id)}
+            if expected_status is not None:
+                query["status"] = expected_status.value
+            
             collection = self.db.integrations
-            await collection.update_one(
-                {"_id": ObjectId(integration_id)},
-                {"$set": update_data}
-            )
+            await collection.update_one(query, {"$set": update_data})
             
         except Exception as e:
             logger.error(f"Error updating integration status: {e}")
@@ -388,30 +501,16 @@ class IntegrationService:
         start_time = time.time()
         
         try:
-            integration = await self.get_integration(integration_id, company_id)
-            if not integration:
+            # Integration and decrypted config from a single read
+            found = await self._get_integration_with_config(integration_id, company_id)
+            if not found:
                 return TestResultResponse(success=False, message="Integration not found")
             
-            # Get decrypted config
-            full_config = await self._get_decrypted_config(integration_id, company_id)
+            integration, full_config = found
             if not full_config:
                 return TestResultResponse(success=False, message="Failed to decrypt configuration")
             
-            # Test based on provider
-            if integration.provider_id == "stripe":
-                return await self._test_stripe(full_config)
-            elif integration.provider_id == "twilio":
-                return await self._test_twilio(full_config)
-            elif integration.provider_id == "quickbooks":
-                return await self._test_quickbooks(full_config)
-            elif integration.provider_id == "google_calendar":
-                return await self._test_google_calendar(full_config)
-            elif integration.provider_id == "mailchimp":
-                return await self._test_mailchimp(full_config)
-            elif integration.provider_id == "google_maps":
-                return await self._test_google_maps(full_config)
-            else:
-                return TestResultResponse(success=False, message=f"Testing not implemented for {integration.provider_id}")
+            return await self._run_provider_test(integration.provider_id, full_config)
             
         except Exception as e:
             logger.error(f"Error testing integration: {e}")
@@ -437,25 +536,24 @@ class IntegrationService:
             records_synced = 0
             errors = []
             
-            if integration.provider_id == "stripe":
-                records_synced, errors = await self._sync_stripe(integration_id, company_id)
-            elif integration.provider_id == "quickbooks":
-                records_synced, errors = await self._sync_quickbooks(integration_id, company_id)
-            # Add other provider sync methods as needed
+            syncer = _SYNCERS.get(integration.provider_id)
+            if syncer:
+                records_synced, errors = await getattr(self, syncer)(integration_id, company_id)
             
             duration_ms = int((time.time() - start_time) * 1000)
             status = "success" if not errors else ("partial" if records_synced > 0 else "error")
             
-            # Update last sync time
-            await self.update_integration_status(integration_id, IntegrationStatus.CONNECTED)
-            
-            await self.log_integration_action(
-                integration_id,
-                company_id,
-                "sync_completed",
-                status,
-                f"Synced {records_synced} records",
-                {"records_synced": records_synced, "errors": errors, "duration_ms": duration_ms}
+            # Update last sync time and log the sync concurrently
+            await asyncio.gather(
+                self.update_integration_status(integration_id, IntegrationStatus.CONNECTED),
+                self.log_integration_action(
+                    integration_id,
+                    company_id,
+                    "sync_completed",
+                    status,
+                    f"Synced {records_synced} records",
+                    {"records_synced": records_synced, "errors": errors, "duration_ms": duration_ms}
+                )
             )
             
             return SyncResultResponse(
@@ -492,14 +590,22 @@ class IntegrationService:
             )
     
     # Helper methods for testing integrations
+    async def _run_provider_test(self, provider_id: str, full_config: Dict[str, Any]) -> TestResultResponse:
+        """Test a decrypted config against its provider"""
+        tester = _TESTERS.get(provider_id)
+        if not tester:
+            return TestResultResponse(success=False, message=f"Testing not implemented for {provider_id}")
+        return await getattr(self, tester)(full_config)
+    
     async def _test_stripe(self, config: Dict[str, Any]) -> TestResultResponse:
         """Test Stripe connection"""
         try:
             import stripe
-            stripe.api_key = config.get("secret_key")
             
-            # Simple test: retrieve account
-            account = stripe.Account.retrieve()
+            # Simple test: retrieve account. The SDK call blocks, so it runs
+            # in a worker thread with the key passed per request rather than
+            # through the global stripe.api_key
+            account = await asyncio.to_thread(stripe.Account.retrieve, api_key=config.get("secret_key"))
             
             return TestResultResponse(
                 success=True,
@@ -514,8 +620,10 @@ class IntegrationService:
         try:
             from twilio.rest import Client
             
-            client = Client(config.get("account_sid"), config.get("auth_token"))
-            account = client.api.accounts(config.get("account_sid")).fetch()
+            account_sid = config.get("account_sid")
+            client = Client(account_sid, config.get("auth_token"))
+            # The SDK fetch blocks, so keep it off the event loop
+            account = await asyncio.to_thread(client.api.accounts(account_sid).fetch)
             
             return TestResultResponse(
                 success=True,
@@ -548,23 +656,22 @@ class IntegrationService:
                 return TestResultResponse(success=False, message="Missing required Google credentials")
             
             # Test API key validity with a simple request
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"https://www.googleapis.com/calendar/v3/users/me/calendarList",
-                    headers={"Authorization": f"Bearer {config.get('api_key')}"}
+            response = await _get_http_client().get(
+                f"https://www.googleapis.com/calendar/v3/users/me/calendarList",
+                headers={"Authorization": f"Bearer {config.get('api_key')}"}
+            )
+            
+            if response.status_code == 200:
+                return TestResultResponse(
+                    success=True,
+                    message="Google Calendar API key validated",
+                    details={"oauth_required": True}
+                )
+            else:
+                return TestResultResponse(
+                    success=False,
+                    message="Google Calendar API key validation failed"
                 )
-                
-                if response.status_code == 200:
-                    return TestResultResponse(
-                        success=True,
-                        message="Google Calendar API key validated",
-                        details={"oauth_required": True}
-                    )
-                else:
-                    return TestResultResponse(
-                        success=False,
-                        message="Google Calendar API key validation failed"
-                    )
         except Exception as e:
             return TestResultResponse(success=False, message=f"Google Calendar test failed: {str(e)}")
     
@@ -577,22 +684,21 @@ class IntegrationService:
             if not api_key or not server_prefix:
                 return TestResultResponse(success=False, message="Missing Mailchimp API key or server prefix")
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"https://{server_prefix}.api.mailchimp.com/3.0/",
-                    auth=("anystring", api_key)
+            response = await _get_http_client().get(
+                f"https://{server_prefix}.api.mailchimp.com/3.0/",
+                auth=("anystring", api_key)
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return TestResultResponse(
+                    success=True,
+                    message=f"Connected to Mailchimp account: {data.get('account_name', 'Unknown')}",
+                    details={"account_id": data.get("account_id"), "email": data.get("email")}
                 )
+            else:
+                return TestResultResponse(success=False, message="Mailchimp API authentication failed")
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    return TestResultResponse(
-                        success=True,
-                        message=f"Connected to Mailchimp account: {data.get('account_name', 'Unknown')}",
-                        details={"account_id": data.get("account_id"), "email": data.get("email")}
-                    )
-                else:
-                    return TestResultResponse(success=False, message="Mailchimp API authentication failed")
-                    
         except Exception as e:
             return TestResultResponse(success=False, message=f"Mailchimp test failed: {str(e)}")
     
@@ -604,27 +710,26 @@ class IntegrationService:
                 return TestResultResponse(success=False, message="Missing Google Maps API key")
             
             # Test with a simple geocoding request
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"https://maps.googleapis.com/maps/api/geocode/json",
-                    params={"address": "1600 Amphitheatre Parkway, Mountain View, CA", "key": api_key}
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("status") == "OK":
-                        return TestResultResponse(
-                            success=True,
-                            message="Google Maps API key validated successfully"
-                        )
-                    else:
-                        return TestResultResponse(
-                            success=False,
-                            message=f"Google Maps API error: {data.get('error_message', 'Unknown error')}"
-                        )
+            response = await _get_http_client().get(
+                f"https://maps.googleapis.com/maps/api/geocode/json",
+                params={"address": "1600 Amphitheatre Parkway, Mountain View, CA", "key": api_key}
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("status") == "OK":
+                    return TestResultResponse(
+                        success=True,
+                        message="Google Maps API key validated successfully"
+                    )
                 else:
-                    return TestResultResponse(success=False, message="Google Maps API request failed")
-                    
+                    return TestResultResponse(
+                        success=False,
+                        message=f"Google Maps API error: {data.get('error_message', 'Unknown error')}"
+                    )
+            else:
+                return TestResultResponse(success=False, message="Google Maps API request failed")
+                
         except Exception as e:
             return TestResultResponse(success=False, message=f"Google Maps test failed: {str(e)}")
     
@@ -647,9 +752,42 @@ class IntegrationService:
             return 0, [str(e)]
     
     # Utility methods
+    def _split_config(
+        self,
+        provider: IntegrationProvider,
+        config_dict: Dict[str, Any]
+    ) -> tuple[Dict[str, Any], Dict[str, Any]]:
+        """Split config into plain fields and encrypted password fields"""
+        password_keys = self._password_keys.get(provider.id, frozenset())
+        safe_config = {}
+        secrets_config = {}
+        
+        for key, value in config_dict.items():
+            if key in password_keys:
+                secrets_config[key] = value
+            else:
+                safe_config[key] = value
+        
+        if not self.cipher_suite:
+            return safe_config, secrets_config  # Fallback if no encryption
+        
+        keys = list(secrets_config)
+        encrypted_values = self._encrypt_many([str(secrets_config[key]).encode() for key in keys])
+        return safe_config, dict(zip(keys, encrypted_values))
+    
+    def _encrypt_many(self, values: List[bytes]) -> List[str]:
+        """Encrypt several values with the shared cipher in one pass"""
+        encrypt = self.cipher_suite.encrypt
+        return [encrypt(value).decode() for value in values]
+    
     async def _get_decrypted_config(self, integration_id: str, company_id: str) -> Optional[Dict[str, Any]]:
-        """Get decrypted configuration for an integration"""
+        """Get decrypted configuration for an integration, cached for a few minutes"""
         try:
+            cache_key = (integration_id, company_id)
+            full_config = _config_cache.get(cache_key)
+            if full_config is not None:
+                return full_config
+            
             collection = self.db.integrations
             doc = await collection.find_one({
                 "_id": ObjectId(integration_id),
@@ -659,27 +797,61 @@ class IntegrationService:
             if not doc:
                 return None
             
-            # Combine safe and encrypted config
-            full_config = doc.get("config", {}).copy()
-            encrypted_config = doc.get("encrypted_config", {})
-            
-            # Decrypt sensitive fields
-            if self.cipher_suite:
-                for key, encrypted_value in encrypted_config.items():
-                    try:
-                        decrypted_value = self.cipher_suite.decrypt(encrypted_value.encode()).decode()
-                        full_config[key] = decrypted_value
-                    except Exception as e:
-                        logger.error(f"Failed to decrypt config key {key}: {e}")
-            else:
-                full_config.update(encrypted_config)
-            
+            full_config = self._decrypt_config(doc)
+            _config_cache.set(cache_key, full_config)
             return full_config
             
         except Exception as e:
             logger.error(f"Error getting decrypted config: {e}")
             return None
     
+    async def _get_integration_with_config(
+        self,
+        integration_id: str,
+        company_id: str
+    ) -> Optional[tuple[Integration, Dict[str, Any]]]:
+        """Get an integration and its decrypted configuration in one query"""
+        cache_key = (integration_id, company_id)
+        full_config = _config_cache.get(cache_key)
+        
+        # With a cached config the secrets need neither fetching nor decrypting
+        collection = self.db.integrations
+        doc = await collection.find_one(
+            {"_id": ObjectId(integration_id), "company_id": company_id},
+            {"encrypted_config": 0} if full_config is not None else None
+        )
+        
+        if not doc:
+            return None
+        
+        if full_config is None:
+            full_config = self._decrypt_config(doc)
+            _config_cache.set(cache_key, full_config)
+        
+        doc["id"] = str(doc.pop("_id"))
+        # Don't return encrypted config
+        doc.pop("encrypted_config", None)
+        return Integration(**doc), full_config
+    
+    def _decrypt_config(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine the plain and decrypted config of an integration document"""
+        encrypted_config = doc.get("encrypted_config", {})
+        
+        # Decrypt sensitive fields, leaving out any that fail
+        if self.cipher_suite:
+            decrypted = {key: self._safe_decrypt(key, value) for key, value in encrypted_config.items()}
+            encrypted_config = {key: value for key, value in decrypted.items() if value is not _DECRYPT_FAILED}
+        
+        return {**doc.get("config", {}), **encrypted_config}
+    
+    def _safe_decrypt(self, key: str, encrypted_value: str) -> Any:
+        """Decrypt one config value, or return _DECRYPT_FAILED and log the error"""
+        try:
+            return self.cipher_suite.decrypt(encrypted_value.encode()).decode()
+        except Exception as e:
+            logger.error(f"Failed to decrypt config key {key}: {e}")
+            return _DECRYPT_FAILED
+    
     # Webhook Management
     async def create_webhook(
         self, 
@@ -713,15 +885,9 @@ class IntegrationService:
         """Get all webhooks for a company"""
         try:
             collection = self.db.webhooks
-            cursor = collection.find({"company_id": company_id})
-            webhooks = []
+            docs = await collection.find({"company_id": company_id}).to_list(length=None)
             
-            async for doc in cursor:
-                doc["id"] = str(doc["_id"])
-                del doc["_id"]
-                webhooks.append(Webhook(**doc))
-            
-            return webhooks
+            return [Webhook(**{**doc, "_id": str(doc["_id"])}) for doc in docs]
         except Exception as e:
             logger.error(f"Error getting webhooks: {e}")
             return []
@@ -782,20 +948,13 @@ class IntegrationService:
         """Get all API keys for a company"""
         try:
             collection = self.db.api_keys
-            cursor = collection.find({"company_id": company_id})
-            api_keys = []
+            docs = await collection.find({"company_id": company_id}).to_list(length=None)
+            api_keys = [ApiKey(**{**doc, "_id": str(doc["_id"])}) for doc in docs]
             
-            async for doc in cursor:
-                doc["id"] = str(doc["_id"])
-                del doc["_id"]
-                
-                api_key = ApiKey(**doc)
-                
-                # Mask the key for security
-                if mask_keys:
+            # Mask the key for security
+            if mask_keys:
+                for api_key in api_keys:
                     api_key.key = api_key.key[:8] + "..." + api_key.key[-4:]
-                
-                api_keys.append(api_key)
             
             return api_keys
         except Exception as e:
@@ -825,7 +984,7 @@ class IntegrationService:
         message: str,
         metadata: Optional[Dict[str, Any]] = None
     ):
-        """Log integration action"""
+        """Queue an integration action log for the background writer"""
         try:
             log_entry = IntegrationLog(
                 integration_id=integration_id,
@@ -836,8 +995,7 @@ class IntegrationService:
                 metadata=metadata or {}
             )
             
-            collection = self.db.integration_logs
-            await collection.insert_one(log_entry.dict(by_alias=True, exclude={"id"}))
+            _integration_log.put(self.db, log_entry.dict(by_alias=True, exclude={"id"}))
             
         except Exception as e:
             logger.error(f"Error logging integration action: {e}")
@@ -855,14 +1013,9 @@ class IntegrationService:
                 "integration_id": integration_id,
                 "company_id": company_id
             }).sort("created_at", -1).limit(limit)
+            docs = await cursor.to_list(length=limit)
             
-            logs = []
-            async for doc in cursor:
-                doc["id"] = str(doc["_id"])
-                del doc["_id"]
-                logs.append(IntegrationLog(**doc))
-            
-            return logs
+            return [IntegrationLog(**{**doc, "_id": str(doc["_id"])}) for doc in docs]
         except Exception as e:
             logger.error(f"Error getting integration logs: {e}")
             return []
\ No newline at end of file
@@ -15,6 +15,10 @@ except Exception:  # pragma: no cover
     InvoiceCreate = BaseModel  # fallback so typing still works
 
 
+# Customer fields used to address the invoice email
+CUSTOMER_FIELDS = {"email": 1, "first_name": 1, "last_name": 1}
+
+
 def _as_objid(value: Any) -> ObjectId | None:
     """Convert a string to ObjectId if valid; pass through ObjectId; else None."""
     if isinstance(value, ObjectId):
@@ -98,7 +102,7 @@ async def create_invoice(
         "_id": oid_contact,
         "role": "customer",
         "company_id": ObjectId(current_user["company_id"])
-    })
+    }, CUSTOMER_FIELDS)
     
     if not customer:
         raise ValueError("Customer not found")
@@ -0,0 +1,65 @@
+# app/utils/log_queue.py
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+class LogQueue:
+    """Writes log documents to a collection in the background with batched inserts.
+
+    Logging happens on request paths, so documents are queued and a
+    consumer task inserts whatever arrived within interval seconds, up to
+    batch_size at a time. When the queue is full new logs are dropped and
+    counted rather than slowing down requests.
+    """
+
+    def __init__(self, collection: str, interval: float, batch_size: int, maxsize: int):
+        self.collection = collection
+        self.interval = interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    def put(self, db: AsyncIOMotorDatabase, doc: Dict[str, Any]) -> None:
+        """Queue a log document and make sure the consumer is running"""
+        self._db = db
+        try:
+            self._queue.put_nowait(doc)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"{self.collection} log queue full, {self.dropped} logs dropped so far")
+            return
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.create_task(self._consume())
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _insert(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            await self._db[self.collection].insert_many(batch, ordered=False)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} {self.collection} logs: {e}")
+
+    async def _consume(self) -> None:
+        # Runs until the queue is empty; put() starts a new one when needed
+        while not self._queue.empty():
+            await asyncio.sleep(self.interval)
+            await self._insert(self._drain())
+
+    async def close(self) -> None:
+        """Let the consumer finish and insert whatever is still queued"""
+        task = self._consumer
+        if task is not None and not task.done():
+            await asyncio.gather(task, return_exceptions=True)
+        while self._db is not None and not self._queue.empty():
+            await self._insert(self._drain())